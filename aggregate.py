@@ -0,0 +1,241 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date
+
+from store import EventStore, day_string, member_days, member_profiles
+from rollup import item_spec, line_spec, rows_between, specNames
+from series import DailySeries
+
+# Everything the plots draw for one date range, computed in a single pass over the member-days, or read off
+# the store's rollup cube when it has one. The plot functions only read from an Analysis, so one analysis serves
+# every plot type and preset.
+
+analysisCacheSize = 16 # Date ranges whose analyses are kept
+
+def add(totals, key, amount):
+    totals[key] = totals.get(key, 0) + amount
+
+def by_name(totals):
+    return {key: totals[key] for key in sorted(totals, key=str)}
+
+def sort_keys(analysis):
+    # Counters, and the specs of each day's items, in name order whichever pass built the analysis, so both give the
+    # same series, colours and legends. Line specs already follow spec_order
+    for name in ('counter_wastage', 'counter_tally', 'counter_purchases', 'counter_totals', 'counter_daily_totals'):
+        setattr(analysis, name, by_name(getattr(analysis, name)))
+    for by_day in (analysis.item_wastage, analysis.item_counts):
+        for ospec, days in by_day.items():
+            by_day[ospec] = {day: by_name(specs) for day, specs in sorted(days.items())}
+
+def add_series(analysis):
+    sort_keys(analysis)
+    analysis.counter_waste = DailySeries.from_dict(analysis.counter_daily_totals, analysis.start, analysis.end)
+    analysis.counter_buys = DailySeries.from_dict(analysis.counter_purchases, analysis.start, analysis.end)
+    for ospec in specNames:
+        analysis.spec_daily_totals[ospec] = DailySeries.from_dict(analysis.spec_totals[ospec], analysis.start, analysis.end)
+    return analysis
+
+@dataclass
+class Analysis:
+    start: date
+    end: date
+    counter_wastage: dict = field(default_factory=dict) # counter -> grams, a member-day's weight split evenly over its counters
+    counter_tally: dict = field(default_factory=dict) # counter -> purchases by weighed members
+    counter_purchases: dict = field(default_factory=dict) # counter -> {day: purchases by weighed members}
+    counter_totals: dict = field(default_factory=dict) # counter -> {day: split grams}
+    counter_daily_totals: dict = field(default_factory=dict) # counter -> {day: full grams of every member who bought there}
+    spec_totals: dict = field(default_factory=dict) # ospec -> spec -> {day: grams}
+    spec_members: dict = field(default_factory=dict) # ospec -> spec -> {day: weighed members}
+    item_wastage: dict = field(default_factory=dict) # ospec -> {day: {spec: grams}}
+    item_counts: dict = field(default_factory=dict) # ospec -> {day: {spec: items bought}}
+    counter_waste: DailySeries = None # counter_daily_totals as dense series
+    counter_buys: DailySeries = None # counter_purchases as dense series
+    spec_daily_totals: dict = field(default_factory=dict) # ospec -> spec_totals[ospec] as dense series
+
+    @property
+    def average_wastage(self):
+        return {counter: total / self.counter_tally[counter] for counter, total in self.counter_wastage.items()}
+
+    @property
+    def daily_counter_wastage(self):
+        return {counter: {day: total / self.counter_purchases[counter][day] for day, total in days.items()} for counter, days in self.counter_totals.items()}
+
+    def spec_series(self, ospec, year_groups=()):
+        # (spec -> {day: grams}, spec -> {day: weighed members}), formclasses only from the given year groups
+        if ospec != 'formclass':
+            return self.spec_totals[ospec], self.spec_members[ospec]
+        totals, members = {}, {}
+        for (yeargroup, formclass), days in self.spec_totals[ospec].items():
+            if yeargroup not in year_groups:
+                continue
+            totals.setdefault(formclass, {})
+            members.setdefault(formclass, {})
+            for day, grams in days.items():
+                add(totals[formclass], day, grams)
+                add(members[formclass], day, self.spec_members[ospec][(yeargroup, formclass)][day])
+        return totals, members
+
+    def spec_daily(self, ospec, year_groups=()):
+        # Dense counterpart of spec_series' totals
+        series = self.spec_daily_totals[ospec]
+        if ospec != 'formclass':
+            return series
+        groups = {}
+        for yeargroup, formclass in series.keys:
+            if yeargroup in year_groups:
+                groups.setdefault(formclass, []).append((yeargroup, formclass))
+        return series.combine(groups)
+
+    def item_series(self, ospec, year_groups=()):
+        # ({day: {spec: grams}}, {day: {spec: items}}) for the per-item bar plots
+        if ospec != 'formclass':
+            return self.item_wastage[ospec], self.item_counts[ospec]
+        series = []
+        for by_day in (self.item_wastage[ospec], self.item_counts[ospec]):
+            merged = {}
+            for day, specs in by_day.items():
+                for (yeargroup, formclass), amount in specs.items():
+                    if yeargroup in year_groups:
+                        add(merged.setdefault(day, {}), formclass, amount)
+            series.append(merged)
+        return tuple(series)
+
+def aggregate(all_data, startDate, endDate):
+    rollup = all_data.rollup() if isinstance(all_data, EventStore) else None
+    if rollup is not None:
+        return aggregate_rollup(*rollup, startDate, endDate)
+
+    analysis = Analysis(startDate, endDate)
+    for ospec in specNames:
+        analysis.spec_totals[ospec] = {}
+        analysis.spec_members[ospec] = {}
+        analysis.item_wastage[ospec] = {}
+        analysis.item_counts[ospec] = {}
+
+    # Every spec gets a series, even without data in the range
+    for member, profile in member_profiles(all_data).items():
+        for ospec in specNames:
+            spec = line_spec(profile, ospec)
+            if spec and spec not in analysis.spec_totals[ospec]:
+                analysis.spec_totals[ospec][spec] = {}
+                analysis.spec_members[ospec][spec] = {}
+
+    for member, profile, day, day_data in member_days(all_data, startDate, endDate):
+        weights = day_data.get('weights')
+        stations = day_data.get('stations')
+        total_weight = sum(weights) if weights else 0
+
+        if weights and stations:
+            weight_per_counter = total_weight / len(stations) # Find average weight per counter, distributed evenly
+            for counter in stations:
+                if counter not in analysis.counter_wastage:
+                    analysis.counter_wastage[counter] = 0
+                    analysis.counter_tally[counter] = 0
+                    analysis.counter_purchases[counter] = {}
+                    analysis.counter_totals[counter] = {}
+                    analysis.counter_daily_totals[counter] = {}
+                analysis.counter_wastage[counter] += weight_per_counter
+                analysis.counter_tally[counter] += 1
+                add(analysis.counter_purchases[counter], day, 1)
+                add(analysis.counter_totals[counter], day, weight_per_counter)
+                add(analysis.counter_daily_totals[counter], day, total_weight)
+
+        for ospec in specNames:
+            spec = line_spec(profile, ospec)
+            if spec and weights:
+                add(analysis.spec_totals[ospec][spec], day, total_weight)
+                add(analysis.spec_members[ospec][spec], day, 1)
+
+            spec = item_spec(profile, ospec)
+            if not spec:
+                continue
+            if weights:
+                add(analysis.item_wastage[ospec].setdefault(day, {}), spec, total_weight)
+            if stations is not None:
+                add(analysis.item_counts[ospec].setdefault(day, {}), spec, len(stations))
+    return add_series(analysis)
+
+def aggregate_rollup(cube, specs, startDate, endDate):
+    # Same Analysis as aggregate, summed from the rollup rows of the date range
+    analysis = Analysis(startDate, endDate)
+    for ospec in specNames:
+        analysis.spec_totals[ospec] = {tuple(spec) if ospec == 'formclass' else spec: {} for spec in specs[ospec]}
+        analysis.spec_members[ospec] = {spec: {} for spec in analysis.spec_totals[ospec]}
+        analysis.item_wastage[ospec] = {}
+        analysis.item_counts[ospec] = {}
+
+    rows = rows_between(cube, startDate, endDate)
+    counters = rows[(rows['counter'] != '') & (rows['weighed_purchases'] > 0)]
+    counters = counters.groupby(['counter', 'day'])[['grams', 'gross_grams', 'weighed_purchases']].sum()
+    day_strings = {}
+    for (counter, day), grams, gross_grams, purchases in counters.itertuples(name=None):
+        if day not in day_strings:
+            day_strings[day] = day_string(day)
+        if counter not in analysis.counter_wastage:
+            analysis.counter_wastage[counter] = 0
+            analysis.counter_tally[counter] = 0
+            analysis.counter_purchases[counter] = {}
+            analysis.counter_totals[counter] = {}
+            analysis.counter_daily_totals[counter] = {}
+        analysis.counter_wastage[counter] += grams
+        analysis.counter_tally[counter] += int(purchases)
+        analysis.counter_purchases[counter][day_strings[day]] = int(purchases)
+        analysis.counter_totals[counter][day_strings[day]] = grams
+        analysis.counter_daily_totals[counter][day_strings[day]] = gross_grams
+
+    member_totals = rows[rows['counter'] == '']
+    columns = ['day', 'house', 'yeargroup', 'formclass', 'role', 'grams', 'purchases', 'weighed_members']
+    for day, house, yeargroup, formclass, role, grams, purchases, weighed_members in member_totals[columns].itertuples(index=False, name=None):
+        if day not in day_strings:
+            day_strings[day] = day_string(day)
+        day = day_strings[day]
+        profile = {'house': house, 'yeargroup': yeargroup, 'formclass': formclass}
+        for ospec in specNames:
+            spec = line_spec(profile, ospec)
+            if spec and weighed_members:
+                add(analysis.spec_totals[ospec][spec], day, grams)
+                add(analysis.spec_members[ospec][spec], day, int(weighed_members))
+
+            spec = (role or None) if ospec == 'staff' else item_spec(profile, ospec)
+            if not spec:
+                continue
+            if weighed_members:
+                add(analysis.item_wastage[ospec].setdefault(day, {}), spec, grams)
+            add(analysis.item_counts[ospec].setdefault(day, {}), spec, int(purchases))
+    return add_series(analysis)
+
+class AnalysisCache:
+    # Least recently used analyses keyed by (snapshot version, start, end). Year group filters are applied when
+    # drawing, so one entry serves every preset on its date range. Data without a snapshot version is never cached
+    def __init__(self, size=analysisCacheSize):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, all_data, startDate, endDate):
+        version = getattr(all_data, 'version', None)
+        if version is None:
+            return aggregate(all_data, startDate, endDate)
+
+        key = (version, startDate.toordinal(), endDate.toordinal())
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        analysis = aggregate(all_data, startDate, endDate)
+        with self.lock:
+            self.entries[key] = analysis
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return analysis
+
+    def invalidate(self, version=None):
+        # Drops every analysis not computed from the given snapshot (everything when version is None)
+        with self.lock:
+            for key in [key for key in self.entries if key[0] != version or version is None]:
+                del self.entries[key]
+
+analysisCache = AnalysisCache()
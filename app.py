@@ -9,15 +9,14 @@ from tkinter import messagebox
 from tkcalendar import DateEntry
 from tkinter import simpledialog
 
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-import matplotlib.image as mpimg
-
 import os
+import queue
 import subprocess
 import sys
+import threading
+import traceback
 
-from main import load_data, report, analyze_data, plot, get_last_date, test
+from main import Cancelled, check_cancel, dataset, report, analyze_data, plot, get_last_date, test
 
 current_date = datetime.date.today().isoformat()
 
@@ -219,15 +218,116 @@ def select_date(root, date_var):
     button_ok = tk.Button(top, text="OK", command=update_date)
     button_ok.pack(pady=10)
 
-def regenerate_data():
-    all_data = report()
-    if all_data:
+class Worker:
+    # Runs one job at a time on a background thread so the window stays responsive. Progress messages and the result
+    # come back through a queue that the Tk loop polls with root.after, clicks while a job is running are ignored
+    def __init__(self, root, status_var, poll_ms=100):
+        self.root = root
+        self.status_var = status_var
+        self.poll_ms = poll_ms
+        self.messages = queue.Queue()
+        self.running = None # Name of the current job
+        self.cancel_event = threading.Event()
+        self.on_done = None
+        self.keep_result = False
+
+    def start(self, name, job, on_done, keep_result=False):
+        # job(progress, cancel) runs on the worker thread, on_done(result) back on the Tk thread. A job that returns
+        # after a cancel has its result dropped, unless keep_result: the job only returns once its result is committed
+        if self.running:
+            self.status_var.set(f"{self.running} is still running, wait for it or cancel it first.")
+            return False
+        self.running = name
+        self.cancel_event = threading.Event()
+        self.on_done = on_done
+        self.keep_result = keep_result
+        self.status_var.set(f"{name}...")
+        threading.Thread(target=self.run, args=(job, self.cancel_event), daemon=True).start()
+        self.root.after(self.poll_ms, self.poll)
+        return True
+
+    def run(self, job, cancel_event):
+        try:
+            self.messages.put(('done', job(self.progress, cancel_event)))
+        except Cancelled:
+            self.messages.put(('cancelled', None))
+        except Exception as e:
+            traceback.print_exc()
+            self.messages.put(('error', e))
+
+    def progress(self, message): # Called from the worker thread
+        self.messages.put(('progress', message))
+
+    def cancel(self):
+        if self.running:
+            self.cancel_event.set()
+            self.status_var.set(f"Cancelling {self.running}...")
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def poll(self):
+        while True:
+            try:
+                kind, value = self.messages.get_nowait()
+            except queue.Empty:
+                self.root.after(self.poll_ms, self.poll)
+                return
+            if kind == 'progress':
+                self.status_var.set(value)
+                continue
+
+            name, on_done = self.running, self.on_done
+            self.running = None
+            if kind == 'done' and self.cancelled() and not self.keep_result: # Finished before it saw the cancel, the result is dropped
+                self.status_var.set(f"{name} cancelled.")
+            elif kind == 'done':
+                self.status_var.set(f"{name} done.")
+                on_done(value)
+            elif kind == 'cancelled':
+                self.status_var.set(f"{name} cancelled.")
+            else:
+                self.status_var.set(f"{name} failed.")
+                messagebox.showerror("Error", f"{name} failed: {value}")
+            return
+
+def run_job(worker, name, job, on_done):
+    # Without a worker the job runs right here, as before
+    if worker is None:
+        on_done(job(print, threading.Event()))
+    else:
+        worker.start(name, job, on_done)
+
+def open_plot_folder():
+    # Open the plot file location
+    plot_file_location = "full_plots"
+    if os.path.exists(plot_file_location):
+        if os.name == 'nt':  # For Windows
+            os.startfile(plot_file_location)
+        elif os.name == 'posix':  # For macOS and Linux
+            if sys.platform == 'darwin':  # macOS
+                subprocess.run(['open', plot_file_location])
+            else:  # Linux
+                subprocess.run(['xdg-open', plot_file_location])
+    else:
+        print(f"Plot file location does not exist: {plot_file_location}")
+
+def show_regenerate_result(all_data):
+    if all_data is not None: # Not truthiness, that would count every member of the store
         messagebox.showinfo("Success", "Data regenerated successfully.")
     else:
         messagebox.showerror("Error", "Failed to regenerate data.")
+
+def regenerate_data(progress=None, cancel=None, incremental=True):
+    all_data = report(incremental, progress, cancel) # Swaps main.dataset to the new snapshot
+    if cancel is None:
+        show_regenerate_result(all_data)
+    elif all_data is None and cancel.is_set(): # report() backed out before the swap
+        raise Cancelled()
     return all_data
 
-def add_plot(startDate, endDate, preset, continous, all_data, customs = None):
+def add_plot(startDate, endDate, preset, continous, customs = None, worker = None):
+    # Dialogs run here on the Tk thread, the analysis and the TV rendering run on the worker when one is given
     startDate = datetime.datetime.strptime(startDate.get(), "%Y-%m-%d").date() # Convert the strings to a date object
     endDate = datetime.datetime.strptime(endDate.get(), "%Y-%m-%d").date()
 
@@ -237,8 +337,6 @@ def add_plot(startDate, endDate, preset, continous, all_data, customs = None):
         messagebox.showerror("Error", "Start date cannot be greater than end date.")
         return
 
-    metadata = analyze_data(all_data, startDate, endDate) # only analyze selected days data
-
     if preset == "Student":
         plots = ['yeargroup', 'house', 'formclass']
     elif preset == "Sodexo":
@@ -251,29 +349,31 @@ def add_plot(startDate, endDate, preset, continous, all_data, customs = None):
             return
         plots = customs
     elif preset == "TV":
-        test(startDate.strftime("%Y-%m-%d"), endDate.strftime("%Y-%m-%d"))
-        # Open the plot file location
-        plot_file_location = "full_plots"
-        if os.path.exists(plot_file_location):
-            if os.name == 'nt':  # For Windows
-                os.startfile(plot_file_location)
-            elif os.name == 'posix':  # For macOS and Linux
-                if sys.platform == 'darwin':  # macOS
-                    subprocess.run(['open', plot_file_location])
-                else:  # Linux
-                    subprocess.run(['xdg-open', plot_file_location])
-        else:
-            print(f"Plot file location does not exist: {plot_file_location}")
+        def render(progress, cancel):
+            test(startDate.strftime("%Y-%m-%d"), endDate.strftime("%Y-%m-%d"), progress, cancel)
+        run_job(worker, "TV plots", render, lambda result: open_plot_folder())
         return
 
     if "formclass" in plots:
         # Prompt the user to enter a list of year groups
         year_groups_input = simpledialog.askstring("Formclass Input", "Enter year groups to show formclasses, separated by commas:")
+        if year_groups_input is None: # Dialog cancelled
+            return
 
         # Split the input string into a list of year groups
         year_groups = [year_group.strip() for year_group in year_groups_input.split(',')]
-    
-    plot(startDate, endDate, plots, metadata, continous, "app_output", year_groups)
+
+    def analyze(progress, cancel):
+        progress("Loading data...")
+        all_data = dataset.get() # the data is opened on first use
+        check_cancel(cancel)
+        progress("Analyzing...")
+        analysis = analyze_data(all_data, startDate, endDate) # only analyze selected days data
+        check_cancel(cancel)
+        return analysis
+
+    # pyplot has to stay on the Tk thread, so only the drawing happens back here
+    run_job(worker, "Preview", analyze, lambda analysis: plot(startDate, endDate, plots, analysis, continous, "app_output", year_groups))
     '''
     # Create a new Tkinter window
     window = tk.Tk()
@@ -298,15 +398,26 @@ def add_plot(startDate, endDate, preset, continous, all_data, customs = None):
     '''
 
 def recap_menu():
-    all_data = load_data()
-
-    def call_regenerate_data():
-        global all_data
-        all_data = regenerate_data()
+    # The data is opened on the first preview through main.dataset, startup only reads the store's manifest
 
     print("Recap menu selected.")
     root = setup_window("Recap Menu", 1)
 
+    status_var = tk.StringVar(root, value="")
+    worker = Worker(root, status_var) # Regenerate and Preview run in the background, one at a time
+
+    def regenerate_done(all_data):
+        show_regenerate_result(all_data) # A regenerate cancelled before its swap raises instead, and never gets here
+
+    def call_regenerate_data():
+        # A regenerate that returns has swapped in its snapshot, a cancel after the swap can't undo it
+        worker.start("Regenerate", regenerate_data, regenerate_done, keep_result=True)
+
+    def call_rebuild_data():
+        # Refetches every record instead of from the watermark, for when the stored data needs replacing
+        if messagebox.askyesno("Full Rebuild", "Refetch all records and rebuild the data? This takes a while."):
+            worker.start("Full rebuild", lambda progress, cancel: regenerate_data(progress, cancel, incremental=False), regenerate_done, keep_result=True)
+
     startDate = tk.StringVar(root, value="2024-05-13")
     endDate = tk.StringVar(root, value=str(get_last_date().date()))
     #endDate = tk.StringVar(root, value=current_date)
@@ -392,10 +503,19 @@ def recap_menu():
     button_regenerate = tk.Button(root, text="Regenerate Data", command=call_regenerate_data, font=button_font) # Regenerate merged data file
     button_regenerate.grid(row=3, column=0, sticky='ew')
 
+    button_rebuild = tk.Button(root, text="Full Rebuild", command=call_rebuild_data, font=button_font) # Regenerate from scratch
+    button_rebuild.grid(row=3, column=2, sticky='ew')
+
     # Add plot and mail buttons
-    button_add_plot = tk.Button(root, text="Preview", command=lambda: add_plot(startDate, endDate, preset_var.get(), continuous_var.get(), all_data, get_selected_options(preset_var)), font=button_font) # Add plot
+    button_add_plot = tk.Button(root, text="Preview", command=lambda: add_plot(startDate, endDate, preset_var.get(), continuous_var.get(), get_selected_options(preset_var), worker), font=button_font) # Add plot
     button_add_plot.grid(row=5, column=0, sticky='ew')
 
+    button_cancel = tk.Button(root, text="Cancel", command=worker.cancel, font=button_font) # Stops the running job
+    button_cancel.grid(row=5, column=1, sticky='ew')
+
+    label_status = tk.Label(root, textvariable=status_var, font=small_button_font) # Progress of the running job
+    label_status.grid(row=6, column=0, columnspan=2, sticky='ew')
+
     '''button_send_mail = tk.Button(root, text="Send Mail", command=ask_credentials, font=button_font) # sender, recipient
     button_send_mail.grid(row=5, column=1, sticky='ew')'''
 
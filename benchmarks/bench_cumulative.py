@@ -0,0 +1,78 @@
+import argparse
+import random
+from datetime import date, datetime, timedelta
+
+from benchmarks.timing import best_of
+from series import DailySeries
+
+# Compares the old running-total loops (strptime-keyed sorts, Python accumulation) with DailySeries prefix sums
+# Usage: python -m benchmarks.bench_cumulative --counters 12 --days 365 --windows 1000
+
+def make_series(counters, days, seed=0):
+    # counter -> {day string: grams}, with some days missing like real counters
+    rnd = random.Random(seed)
+    first = date(2024, 1, 1)
+    series = {}
+    for i in range(counters):
+        series[f'Counter {i}'] = {(first + timedelta(days=day)).strftime('%Y-%m-%d'): rnd.uniform(100, 5000) for day in range(days) if rnd.random() < 0.8}
+    return series, first, first + timedelta(days=days - 1)
+
+def loop_running_totals(series):
+    # What cumulative_plot_waste and cumulative_plot_buys used to do
+    cumulative = {}
+    for counter, daily in series.items():
+        cumulative[counter] = {}
+        sorted_dates = sorted(daily.keys(), key=lambda day: datetime.strptime(day, '%Y-%m-%d'))
+        total = 0
+        for day in sorted_dates:
+            total += daily[day]
+            cumulative[counter][day] = total
+    curves = {}
+    for counter, daily in cumulative.items():
+        sorted_dates = sorted(daily.keys(), key=lambda day: datetime.strptime(day, '%Y-%m-%d'))
+        curves[counter] = (sorted_dates, [daily[day] for day in sorted_dates])
+    return curves
+
+def series_running_totals(daily_series):
+    return {counter: daily_series.running(counter) for counter in daily_series.keys}
+
+def loop_window_totals(series, windows):
+    results = []
+    for start, end in windows:
+        results.append({counter: sum(grams for day, grams in daily.items() if start <= datetime.strptime(day, '%Y-%m-%d').date() <= end) for counter, daily in series.items()})
+    return results
+
+def series_window_totals(daily_series, windows):
+    return [{counter: daily_series.total(counter, start, end) for counter in daily_series.keys} for start, end in windows]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark cumulative series and window totals")
+    parser.add_argument('--counters', type=int, default=12)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--windows', type=int, default=200, help="Random date windows to total")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    series, first, last = make_series(args.counters, args.days)
+    rnd = random.Random(1)
+    windows = []
+    for _ in range(args.windows):
+        start = first + timedelta(days=rnd.randrange(args.days))
+        windows.append((start, min(last, start + timedelta(days=rnd.randrange(1, 60)))))
+
+    build_time, daily_series = best_of(args.repeat, DailySeries.from_dict, series, first, last)
+    loop_time, expected = best_of(args.repeat, loop_running_totals, series)
+    prefix_time, curves = best_of(args.repeat, series_running_totals, daily_series)
+    for counter, (days, totals) in expected.items(): # Same curves, same days
+        assert curves[counter][0] == days
+        assert all(abs(a - b) < 1e-6 for a, b in zip(curves[counter][1], totals))
+
+    loop_window_time, expected_totals = best_of(args.repeat, loop_window_totals, series, windows)
+    prefix_window_time, window_totals = best_of(args.repeat, series_window_totals, daily_series, windows)
+    for expected_window, window in zip(expected_totals, window_totals):
+        assert all(abs(expected_window[counter] - window[counter]) < 1e-6 for counter in expected_window)
+
+    print(f"{args.counters} counters x {args.days} days, {args.windows} windows")
+    print(f"Building the dense series: {build_time * 1000:.1f} ms (once per analysis)")
+    print(f"Running totals: loops {loop_time * 1000:.1f} ms, prefix sums {prefix_time * 1000:.1f} ms ({loop_time / prefix_time:.1f}x)")
+    print(f"Window totals:  loops {loop_window_time * 1000:.1f} ms, prefix sums {prefix_window_time * 1000:.1f} ms ({loop_window_time / prefix_window_time:.1f}x)")
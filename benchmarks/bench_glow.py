@@ -0,0 +1,45 @@
+import argparse
+import io
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from matplotlib.figure import Figure
+
+from benchmarks.timing import best_of
+from glow import add_glow, glowModes
+
+# Times the glow modes of the fullscreen line plots on synthetic series at the fullscreen size and dpi
+# Usage: python -m benchmarks.bench_glow --lines 5 20 60 --days 30 365 --dpi 300
+
+def make_axes(lines, days, dpi, seed=0):
+    rnd = np.random.default_rng(seed)
+    fig = Figure(figsize=(16, 9), dpi=dpi)
+    ax = fig.add_subplot(111)
+    x = np.arange(days)
+    for _ in range(lines):
+        ax.plot(x, np.cumsum(rnd.uniform(0, 1000, days)), linewidth=2.5)
+    return fig, ax
+
+def glow_and_save(fig, ax, mode, dpi): # The timed part, the axes are rebuilt for every run
+    add_glow(ax, mode)
+    fig.savefig(io.BytesIO(), format='png', dpi=dpi)
+
+def time_glow(repeat, lines, days, mode, dpi):
+    return best_of(repeat, glow_and_save, mode, dpi, setup=lambda: make_axes(lines, days, dpi))[0]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the glow modes of the fullscreen line plots")
+    parser.add_argument('--lines', type=int, nargs='+', default=[5, 20, 60])
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 365])
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    baseline = {days: time_glow(args.repeat, 0, days, 'layers', args.dpi) for days in args.days} # Empty axes, savefig alone
+    print(f"16x9 in at {args.dpi} dpi, time to add the glow and save, savefig of empty axes subtracted")
+    print(f"{'lines':>6} {'days':>6} " + ' '.join(f'{mode:>10}' for mode in glowModes))
+    for lines in args.lines:
+        for days in args.days:
+            times = [time_glow(args.repeat, lines, days, mode, args.dpi) - baseline[days] for mode in glowModes]
+            print(f"{lines:>6} {days:>6} " + ' '.join(f'{t * 1000:>8.0f}ms' for t in times))
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Startup cost of the entry points, from `python -X importtime` in fresh interpreters.
+# Usage: python -m benchmarks.bench_import                          (main, app and render)
+#        python -m benchmarks.bench_import main --top 15 --output import_times.json
+
+heavyModules = ['pandas', 'seaborn', 'matplotlib', 'matplotlib.pyplot', 'requests', 'numpy', 'tkinter']
+repoRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_once(module):
+    # Returns (wall seconds, module's cumulative us, {direct import of module: cumulative us}, loaded heavy modules),
+    # or an error message
+    code = f"import sys, {module}; print(','.join(m for m in {heavyModules!r} if m in sys.modules))"
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=repoRoot, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        return result.stderr.strip().splitlines()[-1]
+
+    # Each import is printed after the imports it triggered, indented two spaces per level
+    block = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0 and name.strip() == module:
+            children = {child: cumulative for child_depth, child, cumulative in block if child_depth == 1}
+            loaded = [name for name in result.stdout.strip().split(',') if name]
+            return wall, int(cumulative_us), children, loaded
+        block = [] if depth == 0 else block + [(depth, name.strip(), int(cumulative_us))]
+    return f"{module} not in the -X importtime report"
+
+def measure(module, repeat):
+    runs = [import_once(module) for _ in range(repeat)]
+    errors = [run for run in runs if isinstance(run, str)]
+    if errors:
+        return {'module': module, 'error': errors[0]}
+    best = min(runs, key=lambda run: run[1])
+    return {
+        'module': module,
+        'import_ms': best[1] / 1000,
+        'median_import_ms': statistics.median(run[1] for run in runs) / 1000,
+        'interpreter_ms': min(run[0] for run in runs) * 1000, # Interpreter start, site and the import
+        'loaded': best[3],
+        'heaviest': sorted(((name, cumulative / 1000) for name, cumulative in best[2].items()), key=lambda item: -item[1]),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the entry points")
+    parser.add_argument('modules', nargs='*', default=['main', 'app', 'render'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8, help="Heaviest imports made by each module to list")
+    parser.add_argument('--output', help="Also write the results as JSON, to compare runs")
+    args = parser.parse_args()
+
+    results = [measure(module, args.repeat) for module in args.modules]
+    for result in results:
+        if 'error' in result:
+            print(f"{result['module']}: not importable here ({result['error']})")
+            continue
+        print(f"{result['module']}: {result['import_ms']:.0f} ms import (median {result['median_import_ms']:.0f} ms), {result['interpreter_ms']:.0f} ms with interpreter start")
+        print(f"  loaded: {', '.join(result['loaded']) or 'none of ' + ', '.join(heavyModules)}")
+        for name, ms in result['heaviest'][:args.top]:
+            print(f"  {ms:>8.1f} ms  {name}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
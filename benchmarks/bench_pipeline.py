@@ -0,0 +1,135 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import matplotlib
+matplotlib.use('Agg')
+
+from benchmarks.synthetic import make_dataset
+
+# Times every stage from the POS exports and getrecord records to the TV figures on synthetic data, at several scales,
+# so it shows which stage grows as the school year does. Each stage runs once for the time and once more under
+# tracemalloc for its peak memory (Python and numpy allocations, not memory-mapped files).
+# Usage: python -m benchmarks.bench_pipeline                        (small and medium)
+#        python -m benchmarks.bench_pipeline --scales large --no-memory
+#        python -m benchmarks.bench_pipeline --members 2000 --days 120 --stations 12 --output pipeline.json
+
+scales = { # members, days, stations
+    'small': (300, 20, 6),
+    'medium': (1000, 60, 10),
+    'large': (2500, 180, 12),
+}
+fullscreenPlots = ['counters', 'house', 'formclass']
+yearGroups = ['9', '10', '11']
+
+def measure(function, setup=None, memory=True):
+    # (seconds, peak MB or None, result), setup runs before each run and isn't measured
+    def run():
+        if setup is not None:
+            setup()
+        gc.collect()
+        with contextlib.redirect_stdout(io.StringIO()): # The plot functions print as they go
+            start = time.perf_counter()
+            result = function()
+            return time.perf_counter() - start, result
+
+    seconds, result = run()
+    peak = None
+    if memory:
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return seconds, peak, result
+
+def clear(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+def bench_scale(root, members, days, stations, memory=True):
+    # Runs in root: main's paths (activeData/, combined_data/, cache/, full_plots/) are relative to the working directory
+    import main
+    from matplotlib.figure import Figure
+    from render_cache import renderCacheDirectory
+    from workbooks import cacheDirectory
+
+    start = time.perf_counter()
+    summary = make_dataset(root, members, days, stations)
+    generate_seconds = time.perf_counter() - start
+    os.chdir(root)
+    main.plot_style() # pandas, seaborn and the theme load on first use, they'd otherwise be counted in the first stages
+    startDate, endDate = summary['start'], summary['end']
+    with open(summary['records']) as f:
+        records = json.load(f)
+
+    def plot_on_axes(draw):
+        def run():
+            main.plot_style()
+            ax = Figure(figsize=main.fullscreenSize).add_subplot()
+            draw(ax)
+        return run
+
+    results = []
+    def step(name, function, setup=None):
+        seconds, peak, result = measure(function, setup, memory)
+        results.append({'step': name, 'seconds': seconds, 'peak_mb': peak})
+        return result
+
+    first_export = os.path.basename(summary['exports'][0])[len(main.prefix):-len('.xlsx')]
+    step('getStation (one month, uncached)', lambda: main.getStation({}, first_export), lambda: clear(cacheDirectory))
+    step('getAllStations (uncached)', main.getAllStations, lambda: clear(cacheDirectory))
+    station_data = step('getAllStations (cached)', main.getAllStations)
+    weight_data, member_info, _ = step('parse_records', lambda: main.parse_records(records))
+    step('merge_data', lambda: main.merge_data(station_data, weight_data, member_info, startDate, endDate))
+    all_data = step('load_data', main.load_data)
+    analysis = step('analyze_data', lambda: main.analyze_data(all_data, startDate, endDate), lambda: main.analysisCache.invalidate())
+    step('spec_plot_weights (house, cumulative)', plot_on_axes(lambda ax: main.spec_plot_weights(analysis, ax, 'house', startDate, endDate, True)))
+    step('spec_plot_weights (formclass, daily)', plot_on_axes(lambda ax: main.spec_plot_weights(analysis, ax, 'formclass', startDate, endDate, False, yearGroups)))
+    step('plot_daily_average_wastage (staff)', plot_on_axes(lambda ax: main.plot_daily_average_wastage(analysis, ax, 'staff', startDate, endDate)))
+    step(f'plot_fullscreen ({len(fullscreenPlots)} line plots)', lambda: main.plot_fullscreen(startDate, endDate, fullscreenPlots, analysis, True, True, yearGroups),
+         lambda: clear(renderCacheDirectory))
+    return summary, generate_seconds, results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data")
+    parser.add_argument('--scales', nargs='+', choices=list(scales), default=['small', 'medium'])
+    parser.add_argument('--members', type=int, help="A custom scale instead of --scales, with --days and --stations")
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--stations', type=int, default=10)
+    parser.add_argument('--no-memory', action='store_true', help="Only time the stages, skips the tracemalloc runs")
+    parser.add_argument('--keep', help="Generate into this folder and keep it, instead of a temporary one")
+    parser.add_argument('--output', help="Also write the results as JSON, to compare runs")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', FutureWarning) # seaborn deprecations from the plot functions
+
+    runs = [(f'{args.members}x{args.days}x{args.stations}', (args.members, args.days, args.stations))] if args.members else [(name, scales[name]) for name in args.scales]
+    cwd = os.getcwd()
+    report = []
+    for name, (members, days, stations) in runs:
+        root = os.path.abspath(os.path.join(args.keep, name)) if args.keep else tempfile.mkdtemp(prefix='foodbot-bench-')
+        try:
+            summary, generate_seconds, results = bench_scale(root, members, days, stations, not args.no_memory)
+        finally:
+            os.chdir(cwd)
+            if not args.keep:
+                clear(root)
+
+        print(f"\n{name}: {members} members, {days} days, {stations} stations, {summary['purchases']} purchases, {summary['weighins']} weigh-ins "
+              f"(generated in {generate_seconds:.1f}s)")
+        print(f"  {'stage':<42} {'time':>9} {'peak':>10}")
+        for result in results:
+            peak = f"{result['peak_mb']:.1f} MB" if result['peak_mb'] is not None else '-'
+            print(f"  {result['step']:<42} {result['seconds'] * 1000:>7.0f}ms {peak:>10}")
+        report.append({'scale': name, 'members': members, 'days': days, 'stations': stations,
+                       'purchases': summary['purchases'], 'weighins': summary['weighins'], 'results': results})
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,51 @@
+import argparse
+import os
+import random
+import tempfile
+
+import pandas as pd
+
+from benchmarks.synthetic import write_export
+from benchmarks.timing import best_of
+from workbooks import read_pos_workbook, cardColumn, stationColumn
+
+# Compares the column-projected POS reader with pd.read_excel(sheet_name=None) on a synthetic monthly export
+# Usage: python -m benchmarks.bench_pos_reader --sheets 22 --rows 3000
+
+def make_workbook(file_path, sheets, rows, seed=0):
+    # One export with `sheets` day sheets of `rows` purchases each, in synthetic.posColumns
+    rnd = random.Random(seed)
+    stations = [f'Counter {i}' for i in range(8)]
+    day_sheets = {}
+    for day in range(1, sheets + 1):
+        day_rows = day_sheets[f'Nov {day}'] = []
+        for _ in range(rows):
+            card = rnd.randint(1000000, 1003000)
+            day_rows.append([f'2024-11-{day:02d} 12:{rnd.randint(0, 59):02d}:00', card, card + 5, f'Member {card}', rnd.choice(stations),
+                             'Set Lunch', 1, 32.0, 32.0, 'Card', ''])
+    write_export(file_path, day_sheets)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the POS export reader")
+    parser.add_argument('--sheets', type=int, default=22, help="Day sheets in the workbook")
+    parser.add_argument('--rows', type=int, default=3000, help="Rows per sheet")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, '餐线消费数据-Nov.xlsx')
+        make_workbook(file_path, args.sheets, args.rows)
+        print(f"Workbook: {args.sheets} sheets x {args.rows} rows, {os.path.getsize(file_path) / 1e6:.1f} MB")
+
+        pandas_time, expected = best_of(args.repeat, pd.read_excel, file_path, None)
+        projected_time, sheets = best_of(args.repeat, read_pos_workbook, file_path)
+
+        for sheet_name, df in expected.items(): # Same cards and stations, sheet by sheet
+            assert sheets[sheet_name][cardColumn].tolist() == df[cardColumn].astype('int64').tolist()
+            assert sheets[sheet_name][stationColumn].astype(object).tolist() == df[stationColumn].tolist()
+
+        pandas_memory = sum(df.memory_usage(deep=True).sum() for df in expected.values())
+        projected_memory = sum(df.memory_usage(deep=True).sum() for df in sheets.values())
+        print(f"pd.read_excel:     {pandas_time:.2f}s, {pandas_memory / 1e6:.1f} MB of frames")
+        print(f"read_pos_workbook: {projected_time:.2f}s, {projected_memory / 1e6:.1f} MB of frames")
+        print(f"Speedup: {pandas_time / projected_time:.1f}x")
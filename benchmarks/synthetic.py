@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import random
+from datetime import date, timedelta
+
+from openpyxl import Workbook
+
+from workbooks import cardColumn, stationColumn
+
+# Synthetic school for the benchmarks: members with house/yeargroup/formclass profiles, their purchases at S counters
+# and their weigh-ins over D days, written in the shapes FoodBot reads:
+#   records.json                         getrecord API records (serve them with stand_in_server.py)
+#   activeData/餐线消费数据-<Mon>.xlsx     monthly POS exports with one 'Nov 3' style sheet per day
+# Usage: python -m benchmarks.synthetic out/ --members 1000 --days 60 --stations 10
+
+houses = ['Owens', 'Soong', 'Alleyn', 'Johnson', 'Wodehouse', 'Keswick']
+posColumns = ['交易时间', cardColumn, '会员编号', '会员姓名', stationColumn, '商品名称', '数量', '单价', '金额', '支付方式', '备注']
+firstCard = 1000000
+startDay = date(2024, 5, 13) # regenerate's first day. Day sheets are read back as 2024 dates (and Feb 29 not at all)
+buyChance = 0.7 # Chance a member buys on a given day
+weighChance = 0.6 # Chance a member weighs in on a given day
+staffShare = 0.15
+
+def make_members(members, rnd):
+    # card -> profile in the getrecord fields, staff have no yeargroup or formclass and a staff email
+    profiles = {}
+    for i in range(members):
+        staff = rnd.random() < staffShare
+        yeargroup = '' if staff else str(rnd.randint(7, 13))
+        profiles[firstCard + i] = {
+            'peopleName': f'Member {i}',
+            'house': rnd.choice(houses),
+            'yeargroup': yeargroup,
+            'formclass': '' if staff else yeargroup + rnd.choice('ABCDE'),
+            'balance': f'member{i}@dulwich.org' if staff else f'member{i}@stu.dulwich.org',
+        }
+    return profiles
+
+def day_events(profiles, day, counters, rnd):
+    # One day's POS rows and weigh-in records
+    rows, records = [], []
+    for card, profile in profiles.items():
+        if rnd.random() < buyChance:
+            for _ in range(rnd.choice([1, 1, 1, 2])):
+                rows.append([f'{day} 12:{rnd.randint(0, 59):02d}:00', card, card + 5, profile['peopleName'], rnd.choice(counters),
+                             'Set Lunch', 1, 32.0, 32.0, 'Card', ''])
+        if rnd.random() < weighChance:
+            for _ in range(rnd.choice([1, 1, 2])):
+                records.append({'peopleCard': f'{card:012d}', 'addTime': f'{day} {rnd.randint(11, 13)}:{rnd.randint(0, 59):02d}:{rnd.randint(0, 59):02d}',
+                                'weight': round(rnd.uniform(5, 300), 1), **profile})
+    return rows, records
+
+def export_path(directory, month):
+    return os.path.join(directory, f'餐线消费数据-{date(2024, month, 1):%b}.xlsx')
+
+def write_export(file_path, sheets):
+    workbook = Workbook(write_only=True)
+    for sheet_name, rows in sheets.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(posColumns)
+        for row in rows:
+            worksheet.append(row)
+    workbook.save(file_path)
+
+def make_dataset(root, members=300, days=20, stations=6, start=startDay, seed=0):
+    # Writes records.json and the POS exports under root, returns a summary with the date range and counts
+    end = start + timedelta(days=days - 1)
+    if start.year != 2024 or end.year != 2024 or start <= date(2024, 2, 29) <= end:
+        raise ValueError("The POS exports' day sheets are read as 2024 dates without Feb 29, keep the range within Mar-Dec 2024")
+    rnd = random.Random(seed)
+    profiles = make_members(members, rnd)
+    counters = [f'Counter {i}' for i in range(stations)]
+
+    export_directory = os.path.join(root, 'activeData')
+    os.makedirs(export_directory, exist_ok=True)
+    records, exports, purchases = [], [], 0
+    month, sheets = None, {}
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        if day.month != month and sheets: # Exports are written a month at a time
+            exports.append(export_path(export_directory, month))
+            write_export(exports[-1], sheets)
+            sheets = {}
+        month = day.month
+        rows, day_records = day_events(profiles, day, counters, rnd)
+        sheets[f'{day:%b} {day.day}'] = rows
+        records.extend(day_records)
+        purchases += len(rows)
+    exports.append(export_path(export_directory, month))
+    write_export(exports[-1], sheets)
+
+    records_path = os.path.join(root, 'records.json')
+    with open(records_path, 'w') as f:
+        json.dump(records, f)
+    return {'start': start, 'end': end, 'members': members, 'stations': stations,
+            'purchases': purchases, 'weighins': len(records), 'records': records_path, 'exports': exports}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic FoodBot dataset (getrecord JSON and POS exports)")
+    parser.add_argument('root', help="Folder to write records.json and activeData/ into")
+    parser.add_argument('--members', type=int, default=300)
+    parser.add_argument('--days', type=int, default=20)
+    parser.add_argument('--stations', type=int, default=6)
+    parser.add_argument('--start', type=date.fromisoformat, default=startDay)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    summary = make_dataset(args.root, args.members, args.days, args.stations, args.start, args.seed)
+    print(f"{summary['members']} members, {summary['stations']} stations, {summary['start']} to {summary['end']}: "
+          f"{summary['purchases']} purchases in {len(summary['exports'])} exports, {summary['weighins']} weigh-ins in {summary['records']}")
@@ -0,0 +1,14 @@
+import time
+
+# Timing shared by the benchmarks
+
+def best_of(repeat, function, *args, setup=None):
+    # (fastest of `repeat` runs in seconds, the last run's result). setup() runs before each run without being timed,
+    # what it returns is passed to function ahead of args
+    times = []
+    for _ in range(repeat):
+        setup_args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        result = function(*setup_args, *args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
@@ -0,0 +1,168 @@
+import pandas as pd
+import numpy as np
+
+import json
+import os
+
+from workbooks import current_signature, file_signature
+
+# 会员编号 <-> 卡号 conversion tables, rebuilt whenever conversion.xls changes.
+# Besides the two JSON dictionaries a compact index is kept: both directions as sorted arrays (卡号 as int64, 会员编号
+# as text so IDs like 'A789' and '0456' survive), so whole columns are converted with one binary search instead of a
+# dictionary lookup per cell.
+
+conversionFilename = 'conversion.xls'
+conversionDirectory = 'conversion_dict'
+indexFilename = os.path.join(conversionDirectory, 'conversion_index.npz')
+sourceFilename = os.path.join(conversionDirectory, 'source.json') # Size, mtime and hash of the conversion.xls the tables came from
+
+_conversion_index = None
+
+def save_source_signature(file_path=None, signature=None):
+    signature = signature or file_signature(file_path or conversionFilename)
+    with open(sourceFilename, 'w') as f:
+        json.dump(signature, f)
+
+def source_changed(file_path=None):
+    # True when conversion.xls is not the file the saved tables were built from
+    file_path = file_path or conversionFilename
+    if not os.path.exists(file_path): # Nothing to rebuild from, keep whatever tables exist
+        return False
+    if not os.path.exists(sourceFilename):
+        return True
+    with open(sourceFilename, 'r') as f:
+        recorded = json.load(f)
+
+    current = current_signature(recorded, file_path)
+    if current is None:
+        return True
+    if current != recorded: # Touched or copied, same content
+        save_source_signature(file_path, current)
+    return False
+
+def id_string(value):
+    # 会员编号 as the text the index is keyed by: strings are kept as they are, numbers lose a float's '.0'. None for blanks
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return str(int(value)) if float(value).is_integer() else None
+    if value is None:
+        return None
+    value = str(value).strip()
+    return None if value in ('', 'NaN', 'nan') else value
+
+def card_ids(values):
+    # 卡号 column as int64, with a mask of the entries that are numbers at all
+    numeric = pd.to_numeric(pd.Series(values), errors='coerce')
+    valid = numeric.notna().to_numpy()
+    if pd.api.types.is_integer_dtype(numeric.dtype):
+        return numeric.to_numpy(dtype=np.int64), valid
+    return np.trunc(numeric.fillna(-1).to_numpy(dtype=np.float64)).astype(np.int64), valid
+
+def sorted_pairs(keys, values):
+    # Sorts by key, keeping the last value of a repeated key like a dict would
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    values = values[order]
+    last = np.append(keys[1:] != keys[:-1], True)
+    return keys[last], values[last]
+
+class ConversionIndex:
+    def __init__(self, member_keys, member_values, card_keys, card_values):
+        self.member_keys = member_keys # 会员编号 strings, sorted
+        self.member_values = member_values # 卡号 for each entry of member_keys
+        self.card_keys = card_keys # 卡号, sorted
+        self.card_values = card_values # 会员编号 string for each entry of card_keys
+
+    @classmethod
+    def from_dict(cls, conversion_dict):
+        # Built from the 会员编号 -> 卡号 dictionary so both directions agree with the JSON dictionaries.
+        # Entries without a card number (the 'NaN' cards) or without a 会员编号 are left out
+        members, cards = [], []
+        for member_id, card_id in conversion_dict.items():
+            member_id = id_string(member_id)
+            try:
+                card_id = int(card_id)
+            except (TypeError, ValueError):
+                continue
+            if member_id is None:
+                continue
+            members.append(member_id)
+            cards.append(card_id)
+        members = np.array(members, dtype=str)
+        cards = np.array(cards, dtype=np.int64)
+        return cls(*sorted_pairs(members, cards), *sorted_pairs(cards, members))
+
+    @classmethod
+    def load(cls, file_path=indexFilename):
+        with np.load(file_path) as arrays:
+            return cls(arrays['member_keys'], arrays['member_values'], arrays['card_keys'], arrays['card_values'])
+
+    def save(self, file_path=indexFilename):
+        np.savez(file_path, member_keys=self.member_keys, member_values=self.member_values, card_keys=self.card_keys, card_values=self.card_values)
+
+    def convert_many(self, values, reverse=False, missing=-1):
+        # 会员编号 -> 卡号 for a whole column as int64 (卡号 -> 会员编号 with reverse=True, as an object array of strings).
+        # Unmatched entries are `missing`
+        if reverse:
+            keys, mapped = self.card_keys, self.card_values
+            ids, valid = card_ids(values)
+        else:
+            keys, mapped = self.member_keys, self.member_values
+            ids = [id_string(value) for value in values]
+            valid = np.array([member_id is not None for member_id in ids], dtype=bool)
+            ids = np.array([member_id or '' for member_id in ids], dtype=str)
+
+        if len(keys) == 0:
+            return np.full(len(ids), missing, dtype=object if reverse else np.int64)
+        positions = np.searchsorted(keys, ids).clip(max=len(keys) - 1)
+        found = valid & (keys[positions] == ids)
+        converted = mapped[positions].astype(object) if reverse else mapped[positions]
+        return np.where(found, converted, missing)
+
+def make_conversion_tables(file_path=None):
+    file_path = file_path or conversionFilename
+    conversion_table = pd.read_excel(file_path) # Load the Excel file
+
+    conversion_table['卡号'] = conversion_table['卡号'].apply(lambda x: str(int(x)) if pd.notnull(x) else 'NaN') # Convert all the '卡号' values from floats to integers
+
+    conversion_dict = dict(zip(conversion_table['会员编号'], conversion_table['卡号'])) # Create a dictionary mapping the two ID systems
+    reverse_conversion_dict = {v: str(k) for k, v in conversion_dict.items()} # Create a reverse dictionary mapping the two ID systems
+
+    os.makedirs(conversionDirectory, exist_ok=True) # Create the directory if it doesn't exist
+
+    # Save the dictionaries as JSON files, then the compact index and what they were built from
+    with open(os.path.join(conversionDirectory, 'conversion_dict.json'), 'w') as f:
+        json.dump(conversion_dict, f)
+    with open(os.path.join(conversionDirectory, 'reverse_conversion_dict.json'), 'w') as f:
+        json.dump(reverse_conversion_dict, f)
+    conversion_index = ConversionIndex.from_dict(conversion_dict)
+    conversion_index.save()
+    save_source_signature(file_path)
+
+    return conversion_dict, reverse_conversion_dict, conversion_index
+
+def index_current():
+    # False when the index is missing or was saved with integer 会员编号 keys, which lost IDs like 'A789' and '0456'
+    if not os.path.exists(indexFilename):
+        return False
+    with np.load(indexFilename) as arrays:
+        return arrays['member_keys'].dtype.kind == 'U'
+
+def load_conversion_index():
+    # Rebuilds everything first if conversion.xls changed since the last build
+    global _conversion_index
+    dict_filename = os.path.join(conversionDirectory, 'conversion_dict.json')
+    if source_changed() or not index_current() and os.path.exists(conversionFilename):
+        print("Conversion tables missing or out of date. Rebuilding from conversion.xls...")
+        _, _, _conversion_index = make_conversion_tables()
+    elif not index_current(): # Only the old JSON dictionaries or an old index are around
+        with open(dict_filename, 'r') as f:
+            _conversion_index = ConversionIndex.from_dict(json.load(f))
+        _conversion_index.save()
+    elif _conversion_index is None:
+        _conversion_index = ConversionIndex.load()
+    return _conversion_index
+
+def convert_many(values, reverse=False, missing=-1):
+    return load_conversion_index().convert_many(values, reverse, missing)
@@ -0,0 +1,121 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import codecs
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+api_url = os.environ.get('FOODBOT_API_URL', "http://10.10.0.44/beijingdev/dev/getrecord") # Point at stand_in_server.py for local runs
+
+chunkDays = 7 # Days of records requested per window
+fetchWorkers = 4 # Windows fetched at the same time
+fetchTimeout = 60 # Seconds before a window request is retried
+fetchRetries = 3
+streamChunkSize = 64 * 1024 # Bytes read from the response at a time
+
+def make_session(workers=fetchWorkers, retries=fetchRetries, backoff=0.5):
+    # One pooled session shared by every window, with retries and exponential backoff on failures
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def split_windows(startDate, endDate, chunk_days=chunkDays):
+    # Returns (begin, end, lower, upper) per window, lower/upper are the day strings a window keeps
+    if isinstance(startDate, datetime):
+        startDate = startDate.date()
+    if isinstance(endDate, datetime):
+        endDate = endDate.date()
+
+    windows = []
+    begin = startDate
+    while begin <= endDate:
+        next_begin = begin + timedelta(days=chunk_days)
+        if next_begin > endDate: # Last window, ask for exactly what the caller asked for
+            windows.append((begin, endDate, None if begin == startDate else begin.strftime('%Y-%m-%d'), None))
+        else:
+            # Whether endTime is inclusive or not, asking up to the next window's first day and then dropping it
+            # means no day is missed and no day is counted twice
+            windows.append((begin, next_begin, None if begin == startDate else begin.strftime('%Y-%m-%d'), next_begin.strftime('%Y-%m-%d')))
+        begin = next_begin
+    return windows
+
+def iter_json_array(chunks):
+    # Yields the items of a JSON array as its bytes arrive, without holding the whole payload
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    started = False
+
+    for chunk in chunks:
+        buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,': # Skip whitespace and separators between items
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError(f"Expected a JSON array, got: {buffer[pos:pos + 100]!r}")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError: # Item is cut off at the end of this chunk, wait for the next one
+                break
+            yield item
+
+    raise ValueError("JSON array ended before its closing bracket")
+
+def stream_window(session, url, begin, end, lower, upper, timeout=fetchTimeout):
+    params = { # Parameters for the API request
+        "beginTime": begin.strftime('%Y-%m-%d'),
+        "endTime": end.strftime('%Y-%m-%d')
+    }
+    with session.get(url, params=params, timeout=timeout, stream=True) as response:
+        response.raise_for_status() # Check for any errors in the response
+        for data in iter_json_array(response.iter_content(chunk_size=streamChunkSize)):
+            day = data.get('addTime').split(' ')[0]
+            if (lower is None or day >= lower) and (upper is None or day < upper):
+                yield data
+
+def fetch_window(session, url, begin, end, lower, upper, timeout=fetchTimeout):
+    return list(stream_window(session, url, begin, end, lower, upper, timeout))
+
+def iter_records(startDate, endDate, url=None, chunk_days=chunkDays, workers=fetchWorkers, timeout=fetchTimeout):
+    # Fetches the range window by window in parallel and yields the records in date order.
+    # At most 2 * workers windows are held at once, and a failed window raises instead of leaving a gap.
+    # With workers=1 nothing is buffered, records are yielded as they come off the wire
+    url = url or api_url
+    windows = split_windows(startDate, endDate, chunk_days)
+
+    if workers <= 1:
+        with make_session(1) as session:
+            for window in windows:
+                yield from stream_window(session, url, *window, timeout)
+        return
+
+    with make_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        try:
+            for window in windows:
+                pending.append(executor.submit(fetch_window, session, url, *window, timeout))
+                if len(pending) >= 2 * workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for future in pending: # Don't wait on windows nobody will read
+                future.cancel()
@@ -0,0 +1,35 @@
+import matplotlib.patheffects as pe
+from matplotlib.colors import to_rgba
+
+# Glow behind the line series of the fullscreen plots.
+#   'layers' overlays four wide translucent copies of every line, five Agg strokes and artists per series
+#   'stroke' adds one glow artist per series, drawn as two path-effect strokes with about the same opacity profile
+
+glowModes = ['layers', 'stroke']
+glowLayers = [(0.05, 12), (0.1, 10), (0.2, 8), (0.3, 6)] # (alpha, linewidth) from the outside in
+glowStrokes = [(0.15, 10), (0.44, 6)] # Stacked these give ~0.52 within 3pt of the line and ~0.15 out to 5pt, like glowLayers
+
+def glow_layers(ax):
+    # Simulate a glow effect by layering lines with increasing opacity
+    for series_line in ax.get_lines():
+        line_color = series_line.get_color()  # Get the color of the primary line
+        rgba_color = to_rgba(line_color)
+
+        # Overlay multiple lines with decreasing opacity for glow
+        for alpha, lw in glowLayers:
+            ax.plot(series_line.get_xdata(), series_line.get_ydata(),
+                    color=(rgba_color[0], rgba_color[1], rgba_color[2], alpha),
+                    linewidth=lw, zorder=-1)
+
+def glow_stroke(ax):
+    # The glow line itself is never drawn, only its strokes, at zorder -1 so no glow covers another series
+    for series_line in list(ax.get_lines()):
+        rgba_color = to_rgba(series_line.get_color())
+        glow_line, = ax.plot(series_line.get_xdata(), series_line.get_ydata(), color=rgba_color[:3], zorder=-1)
+        glow_line.set_path_effects([pe.Stroke(linewidth=lw, foreground=rgba_color[:3], alpha=alpha) for alpha, lw in glowStrokes])
+
+def add_glow(ax, mode='layers'):
+    if mode == 'stroke':
+        glow_stroke(ax)
+    else:
+        glow_layers(ax)
@@ -1,54 +1,62 @@
-import pandas as pd
-import requests
+import numpy as np
 import collections
 from collections import defaultdict
 
-import seaborn as sns
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import matplotlib.patheffects as pe
-from matplotlib.colors import to_rgba
-
 import json
 import os
-from datetime import datetime, timedelta
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from importlib.metadata import version
 
-from matplotlib.font_manager import FontProperties
+from store import EventStore, day_ordinal, is_store, read_manifest, snapshot_version, write_store, write_store_from_dict
+from aggregate import Analysis, aggregate, analysisCache
+from render_cache import fetch_render, render_key, store_render
 
-font = FontProperties(fname="/System/Library/Fonts/PingFang.ttc")
+# pandas, seaborn, matplotlib and requests (and fetch, conversion, workbooks, glow that use them) take about a second
+# to import, so they are imported by the functions that need them. The app's login window and get_last_date() don't
+# need any of them, so they open without that wait
+font = None # Set by plot_style() with the seaborn theme
 
 directory = 'activeData'
 prefix = '餐线消费数据-'
 
-dataFilename = 'combined_data/new_merged_data.json' #merged_data.json
-
-# Set Seaborn theme with the red background and appropriate axis styling
-sns.set_theme(style="darkgrid", rc={"axes.facecolor": "#9B0532", "figure.facecolor": "#9B0532", "grid.color": "gray", "axes.edgecolor": "lightgray"})
+dataFilename = 'combined_data/store' # Columnar event store, see store.py
+legacyDataFilename = 'combined_data/new_merged_data.json' #merged_data.json, converted to the store on first load
+watermarkFilename = 'combined_data/watermark.json' # Last ingested 'addTime', lets report() fetch only new records
+progressEvery = 5000 # Records between progress reports while fetching
+renderWorkers = os.cpu_count() or 1 # Processes rendering the TV figures, 1 renders them one by one in this process
+fullscreenSize = (16, 9)
+fullscreenDpi = 300
+renderVersion = 1 # Bump when render_fullscreen's drawing changes, so cached renders aren't reused
+glowMode = 'layers' # Line glow in the fullscreen plots, 'layers' or the cheaper 'stroke' (see glow.py)
+
+def plot_style():
+    # Called before a figure is created, sets the theme once per process
+    global font
+    if font is None:
+        import seaborn as sns
+        from matplotlib.font_manager import FontProperties
+
+        # Set Seaborn theme with the red background and appropriate axis styling
+        sns.set_theme(style="darkgrid", rc={"axes.facecolor": "#9B0532", "figure.facecolor": "#9B0532", "grid.color": "gray", "axes.edgecolor": "lightgray"})
+        font = FontProperties(fname="/System/Library/Fonts/PingFang.ttc")
+    return font
 
 def make_conversion_dicts():
-    
-    conversion_table = pd.read_excel('conversion.xls') # Load the Excel file
-
-    conversion_table['卡号'] = conversion_table['卡号'].apply(lambda x: str(int(x)) if pd.notnull(x) else 'NaN') # Convert all the '卡号' values from floats to integers
-
-    conversion_dict = dict(zip(conversion_table['会员编号'], conversion_table['卡号'])) # Create a dictionary mapping the two ID systems
-    reverse_conversion_dict = {v: str(k) for k, v in conversion_dict.items()} # Create a reverse dictionary mapping the two ID systems
-
-    if not os.path.exists('conversion_dict'): # Create the directory if it doesn't exist
-        os.makedirs('conversion_dict')
-
-    # Save the dictionaries as JSON files
-    with open('conversion_dict/conversion_dict.json', 'w') as f:
-        json.dump(conversion_dict, f)
-    with open('conversion_dict/reverse_conversion_dict.json', 'w') as f:
-        json.dump(reverse_conversion_dict, f)
-
+    from conversion import make_conversion_tables
+    conversion_dict, reverse_conversion_dict, _ = make_conversion_tables() # Also rebuilds the compact conversion index
     return conversion_dict, reverse_conversion_dict
 
 def load_conversion_dicts():
+    from conversion import source_changed
     if not os.path.exists('conversion_dict'):
         print("Conversion dictionaries not found. Creating new dictionaries...")
         conversion_dict, reverse_conversion_dict = make_conversion_dicts()
+    elif source_changed(): # conversion.xls was updated since the dictionaries were made
+        print("conversion.xls has changed. Recreating dictionaries...")
+        conversion_dict, reverse_conversion_dict = make_conversion_dicts()
 
     # Load the dictionaries from the JSON files
     with open('conversion_dict/conversion_dict.json', 'r') as f:
@@ -65,37 +73,69 @@ def getDate():
     return datetime.now().strftime('%Y-%m-%d')
 
 def load_data(file_path = dataFilename):
-    with open(file_path, 'r') as f:
-        all_data = json.load(f)
-    return all_data
-
-def getWeightsbyDate(startDate, endDate):
-    weight_data = {} # Initialize dictionary to store weight data
-    member_info = {}
-
-    api_url = "http://10.10.0.44/beijingdev/dev/getrecord"
-    startDateForm = startDate.strftime('%Y-%m-%d') # Convert the date objects to strings
-    endDateForm = endDate.strftime('%Y-%m-%d')
-    params = { # Parameters for the API request
-        "beginTime": startDateForm,
-        "endTime": endDateForm
-    }
+    if file_path.endswith('.json'): # Old nested JSON format
+        with open(file_path, 'r') as f:
+            all_data = json.load(f)
+        return all_data
+
+    if not is_store(file_path) and os.path.exists(legacyDataFilename): # Convert the old merged JSON once
+        print(f"Converting {legacyDataFilename} to the event store...")
+        write_store_from_dict(file_path, load_data(legacyDataFilename))
+    return EventStore.open(file_path) # Memory-maps the columns, nothing is parsed up front
+
+class Dataset:
+    # Process-wide handle on the current snapshot of the store. It is opened on first use, shared by the app,
+    # report() and test(), and swapped under a lock when a regenerate writes a new snapshot, so the previous
+    # snapshot is dropped instead of lingering in whoever loaded it
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.all_data = None
+
+    def get(self):
+        with self.lock:
+            if self.all_data is None or self.stale():
+                self.all_data = load_data(dataFilename)
+            return self.all_data
+
+    def stale(self):
+        # Another process may have written a newer snapshot, the manifest tells without opening the data
+        return self.all_data.path != dataFilename or not is_store(dataFilename) or snapshot_version(dataFilename) != self.all_data.version
+
+    def reload(self):
+        # Opens the snapshot just written and makes it the current one
+        all_data = load_data(dataFilename)
+        with self.lock:
+            self.all_data = all_data
+        return all_data
+
+dataset = Dataset()
+
+def fetch_records(startDate, endDate):
+    import requests
+    from fetch import iter_records
     try:
-        response = requests.get(api_url, params=params) # Send a GET request to the API
-        response.raise_for_status() # Check for any errors in the response
-        api_data = response.json() # Parse the JSON response
-    except requests.exceptions.JSONDecodeError: # Handle JSON decoding errors
-        print(f"Error: Unable to decode JSON response from API. Response text: {response.text}")
+        api_data = list(iter_records(startDate, endDate)) # Fetched in parallel per-week windows, merged in date order
+    except ValueError as e: # Handle JSON decoding errors
+        print(f"Error: Unable to decode JSON response from API: {e}")
         api_data = []
-    except requests.exceptions.RequestException as e: # Handle other request exceptions
+    except requests.exceptions.RequestException as e: # Handle other request exceptions, a failed window fails the whole fetch
         print(f"API request error: {e}")
         api_data = []
+    return api_data
+
+def parse_records(api_data):
+    weight_data = {} # Initialize dictionary to store weight data
+    member_info = {}
+    last_add_time = None # Latest 'addTime' seen, used as the ingestion watermark
 
     # Store API data into the global dictionary
     for data in api_data: # Iterate over the data from the API
         peopleCard = data.get('peopleCard') # Gets card ID of the person
         cardNum = peopleCard.lstrip('0') # Removes leading zeros from the card ID
-        day = data.get('addTime').split(' ')[0] # Gets the date from the 'addTime' field
+        add_time = data.get('addTime')
+        day = add_time.split(' ')[0] # Gets the date from the 'addTime' field
+        if last_add_time is None or add_time > last_add_time: # 'YYYY-MM-DD HH:MM:SS' strings sort chronologically
+            last_add_time = add_time
         if day not in weight_data: # If the date is not in the dictionary, add it
             weight_data[day] = {}
         if cardNum not in weight_data[day]: # If the card ID is not in the weights dictionary, add it
@@ -113,56 +153,50 @@ def getWeightsbyDate(startDate, endDate):
             }
         weight_data[day][cardNum]['weights'].append(data['weight']) # Add the weight to the dictionary
 
+    return weight_data, member_info, last_add_time
+
+def getWeightsbyDate(startDate, endDate):
+    weight_data, member_info, _ = parse_records(fetch_records(startDate, endDate))
     return weight_data, member_info
 
 def ALTgetWeightsbyDate(startDate, endDate): # Get weights from local JSON file
-    weight_data = {} # Initialize dictionary to store weight data
-    member_info = {}
-
-    startDateForm = startDate.strftime('%Y-%m-%d') # Convert the date objects to strings
-    endDateForm = endDate.strftime('%Y-%m-%d')
-
+    from fetch import iter_json_array, streamChunkSize
     try:
-        with open('1106data.json', 'r') as file:
-            api_data = json.load(file) # Load data from the JSON file
-    except json.JSONDecodeError: # Handle JSON decoding errors
-        print(f"Error: Unable to decode JSON data from file.")
-        api_data = []
+        with open('1106data.json', 'rb') as file:
+            chunks = iter(lambda: file.read(streamChunkSize), b'')
+            weight_data, member_info, _ = parse_records(iter_json_array(chunks)) # Records are parsed as the file is read
+    except ValueError as e: # Handle JSON decoding errors
+        print(f"Error: Unable to decode JSON data from file: {e}")
+        weight_data, member_info = {}, {}
     except FileNotFoundError: # Handle file not found error
-        print(f"Error: File '1106data.json' not found.")
-        api_data = []
+        print("Error: File '1106data.json' not found.")
+        weight_data, member_info = {}, {}
     except Exception as e: # Handle other exceptions
         print(f"Error: {e}")
-        api_data = []
-
-    # Store API data into the global dictionary
-    for data in api_data: # Iterate over the data from the JSON file
-        peopleCard = data.get('peopleCard') # Gets card ID of the person
-        cardNum = peopleCard.lstrip('0') # Removes leading zeros from the card ID
-        day = data.get('addTime').split(' ')[0] # Gets the date from the 'addTime' field
-        if day not in weight_data: # If the date is not in the dictionary, add it
-            weight_data[day] = {}
-        if cardNum not in weight_data[day]: # If the card ID is not in the weights dictionary, add it
-            weight_data[day][cardNum] = {
-                'weights': []
-            }
-        cardInt = int(cardNum)
-        if cardInt not in member_info: # If the card ID is not in the member info dictionary, add it
-            member_info[cardInt] = {
-                'peopleName': data.get('peopleName'),
-                'house': data.get('house'),
-                'yeargroup': data.get('yeargroup'),
-                'formclass': data.get('formclass'),
-                'balance': data.get('balance')
-            }
-        weight_data[day][cardNum]['weights'].append(data['weight']) # Add the weight to the dictionary
+        weight_data, member_info = {}, {}
 
     return weight_data, member_info
 
+def load_watermark():
+    # Returns the last ingested 'addTime', or None if nothing has been ingested yet
+    if not os.path.exists(watermarkFilename):
+        return None
+    with open(watermarkFilename, 'r') as f:
+        return json.load(f).get('addTime')
+
+def save_watermark(add_time):
+    os.makedirs(os.path.dirname(watermarkFilename), exist_ok=True)
+    with open(watermarkFilename, 'w') as f:
+        json.dump({'addTime': add_time}, f)
+
 def getStation(station_data, filename):
+    from workbooks import read_workbook
 
     file_path = os.path.join(directory, f'{prefix}{filename}.xlsx')
-    excel_file = pd.read_excel(file_path, sheet_name=None)  # Read the Excel file
+    excel_file = read_workbook(file_path)  # Read the Excel file, unchanged workbooks come from the parsed-workbook cache
+    return add_sheets(station_data, filename, excel_file)
+
+def add_sheets(station_data, filename, excel_file):
     if filename not in ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']: 
         station_data[filename] = list(excel_file.values())[0]  # Store the DataFrame in the dictionary
     else:
@@ -176,85 +210,218 @@ def getStation(station_data, filename):
             station_data[new_sheet_name] = sheet_data  # Store the DataFrame in the dictionary
     return station_data
 
-def getAllStations():
+def getAllStations(workers=None):
+    from workbooks import read_workbooks
     station_data = {}
 
-    for filename in os.listdir(directory):
-        if filename.startswith(prefix) and filename.endswith(".xlsx"):
-            station_data = getStation(station_data, filename.replace('.xlsx', '').replace('餐线消费数据-', ''))
+    # Sorted so later files win the same way on every run
+    filenames = sorted(filename for filename in os.listdir(directory) if filename.startswith(prefix) and filename.endswith(".xlsx"))
+    file_paths = [os.path.join(directory, filename) for filename in filenames]
+    for filename, excel_file in zip(filenames, read_workbooks(file_paths, workers)): # Uncached workbooks are parsed in parallel
+        station_data = add_sheets(station_data, filename.replace('.xlsx', '').replace('餐线消费数据-', ''), excel_file)
     return station_data
 
-def report():
+class Cancelled(Exception): # Raised at the next check once a job's cancel event is set
+    pass
 
+def check_cancel(cancel):
+    if cancel is not None and cancel.is_set():
+        raise Cancelled()
+
+def report_progress(progress, message):
+    print(message)
+    if progress is not None:
+        progress(message)
+
+def report(incremental=True, progress=None, cancel=None):
+    # progress is called with status messages and cancel is a threading.Event, both for running in a background thread.
+    # Cancelling before the new snapshot is swapped in leaves the current one as it was, after the swap it is ignored
+    try:
+        return regenerate(incremental, progress, cancel)
+    except Cancelled:
+        report_progress(progress, "Regenerate cancelled.")
+        return
+
+def regenerate(incremental, progress, cancel):
+    import requests
+    from fetch import iter_records
+    report_progress(progress, "Reading station workbooks...")
     station_data = getAllStations() # puts station data in dict
     #station_data = {}
+    check_cancel(cancel)
 
     initDate = datetime.strptime("2024-05-13", '%Y-%m-%d')
     currentDate = datetime.today()
-    weight_data, member_info = getWeightsbyDate(initDate, currentDate) # puts weights in dict
+
+    watermark = load_watermark() if incremental else None
+    existing = None
+    if watermark and (is_store(dataFilename) or os.path.exists(legacyDataFilename)):
+        # Only fetch from the day of the last ingested record, that day may have been partially ingested so it is replaced
+        startDate = datetime.strptime(watermark.split(' ')[0], '%Y-%m-%d')
+        existing = dataset.get()
+        print(f"Incremental regenerate from {startDate.strftime('%Y-%m-%d')} (watermark {watermark})")
+    else:
+        startDate = initDate
+
+    try:
+        # Weight records are streamed off the API straight into compact columns
+        report_progress(progress, "Fetching weight records...")
+        weights, members, last_add_time = collect_records(iter_records(startDate, currentDate), startDate, currentDate, progress, cancel)
+    except ValueError as e: # Handle JSON decoding errors
+        report_progress(progress, f"Error: Unable to decode JSON response from API: {e}")
+        return
+    except requests.exceptions.RequestException as e: # Handle other request exceptions
+        report_progress(progress, f"API request error: {e}")
+        return
 
     '''if not station_data:
         print("No station data found for the given date range.")
         return'''
-    if not weight_data:
-        print("No weight data found for the given date range.")
+    if last_add_time is None:
+        report_progress(progress, "No weight data found for the given date range.")
         return
 
     #print(f"Station Data: {station_data}")
     #print(f"Weight Data: {weight_data}")
 
-    all_data = merge_data(station_data, weight_data, member_info, initDate, currentDate)
+    check_cancel(cancel)
+    report_progress(progress, f"Merging {len(weights)} weigh-ins...")
+    watermark = max(last_add_time, watermark or '')
+    all_data = merge_frames(station_data, weights, members, startDate, currentDate, existing, watermark, initDate, cancel) # Also station sheets from before startDate that changed
+    save_watermark(watermark)
 
     return all_data
 
-def merge_data(station_data, weight_data, member_info, startDate, endDate):
-    global dataFilename
-    all_data = {} # Initializing dict to store merged data
-
-    currentDate = startDate
-    while currentDate <= endDate: # Iterate over the dates in between
-        day = currentDate.strftime('%Y-%m-%d')  # Convert the date obj back to a string
-  
-        if day in station_data: # Station data present for that day
-            df = station_data[day]
-            member_id = df['卡号']  # Get list of IDs on each day
-            pos_name = df['POS机名称']  # Get list of POS names on each day
-
-            for i, stu_id in enumerate(member_id):
-                
-                stu_id = int(stu_id)
-
-                if stu_id not in all_data: # Initializes ID key if it doesn't exist
-                    all_data[stu_id] = {}
-                if day not in all_data[stu_id]: # Then initializes day key for that ID if it doesn't exist
-                    all_data[stu_id][day] = {'stations': [], 'weights': []}
-
-                all_data[stu_id][day]['stations'].append(pos_name[i]) # Adds station name data to the dictionary
-        
-        # Process weight_data for the current day
-        if day in weight_data: # Weight data present for that day
-            for stu_id, weight_info in weight_data[day].items():
-                stu_id = int(stu_id)
-                if stu_id not in all_data: # Initializes ID key if it doesn't exist
-                    all_data[stu_id] = {}
-                if day not in all_data[stu_id]: # Then initializes day key for that ID if it doesn't exist
-                    all_data[stu_id][day] = {'stations': [], 'weights': []}
-
-                for weight in weight_info['weights']: # Adds weight data to the dictionary
-                    all_data[stu_id][day]['weights'].append(weight)
-                if 'name' not in all_data[stu_id]: # If member info not already in the dictionary
-                    all_data[stu_id]['name'] = member_info[stu_id]['peopleName'] # Adds member info to the dictionary
-                    all_data[stu_id]['house'] = member_info[stu_id]['house']
-                    all_data[stu_id]['yeargroup'] = member_info[stu_id]['yeargroup']
-                    all_data[stu_id]['formclass'] = member_info[stu_id]['formclass']
-                    all_data[stu_id]['balance'] = member_info[stu_id]['balance']
-
-        currentDate += timedelta(days=1)  # Move to the next day
-    
-    # Save the dictionary to a JSON file
-    with open(dataFilename, 'w') as f:
-        json.dump(all_data, f, default=set_default)
+def collect_records(records, startDate, endDate, progress=None, cancel=None):
+    # Consumes the record stream into flat card/day/weight columns plus the first profile seen for each card,
+    # nothing per-record is kept as a dict. Returns the weigh-ins as a DataFrame, the profiles and the latest 'addTime'
+    import pandas as pd
+    first_day = startDate.strftime('%Y-%m-%d')
+    last_day = endDate.strftime('%Y-%m-%d')
+    cards, days, grams = array('q'), array('i'), array('d')
+    members = {}
+    ordinals = {}
+    last_add_time = None
+
+    for count, data in enumerate(records, 1): # Consumes the records one at a time
+        if count % progressEvery == 0:
+            check_cancel(cancel) # Closing the stream stops the fetch
+            if progress is not None:
+                progress(f"Fetched {count} records...")
+        add_time = data.get('addTime')
+        day = add_time.split(' ')[0] # Gets the date from the 'addTime' field
+        if day < first_day or day > last_day: # Skip days outside the date range
+            continue
+        if last_add_time is None or add_time > last_add_time:
+            last_add_time = add_time
+        if day not in ordinals:
+            ordinals[day] = day_ordinal(day)
+
+        cardInt = int(data.get('peopleCard').lstrip('0')) # Removes leading zeros from the card ID
+        cards.append(cardInt)
+        days.append(ordinals[day])
+        grams.append(data['weight'])
+        if cardInt not in members: # If the card ID is not in the member info dictionary, add it
+            members[cardInt] = {
+                'name': data.get('peopleName'),
+                'house': data.get('house'),
+                'yeargroup': data.get('yeargroup'),
+                'formclass': data.get('formclass'),
+                'balance': data.get('balance')
+            }
 
+    weights = pd.DataFrame({
+        'card': np.frombuffer(cards, dtype=np.int64) if cards else np.empty(0, dtype=np.int64),
+        'day': np.frombuffer(days, dtype=np.int32) if days else np.empty(0, dtype=np.int32),
+        'weight': np.frombuffer(grams, dtype=np.float64) if grams else np.empty(0, dtype=np.float64)
+    })
+    return weights, members, last_add_time
+
+def merge_data(station_data, weight_data, member_info, startDate, endDate):
+    # weight_data/member_info as returned by getWeightsbyDate, flattened into columns and merged with merge_frames
+    import pandas as pd
+    cards, days, grams = [], [], []
+    for day, day_weights in weight_data.items():
+        ordinal = day_ordinal(day)
+        for cardNum, weight_info in day_weights.items():
+            cards.extend([int(cardNum)] * len(weight_info['weights']))
+            days.extend([ordinal] * len(weight_info['weights']))
+            grams.extend(weight_info['weights'])
+    weights = pd.DataFrame({
+        'card': np.array(cards, dtype=np.int64),
+        'day': np.array(days, dtype=np.int32),
+        'weight': np.array(grams, dtype=np.float64)
+    })
+    members = {
+        card: {'name': info['peopleName'], 'house': info['house'], 'yeargroup': info['yeargroup'], 'formclass': info['formclass'], 'balance': info['balance']}
+        for card, info in member_info.items()
+    }
+    return merge_frames(station_data, weights, members, startDate, endDate)
+
+def merge_frames(station_data, weights, members, startDate, endDate, existing=None, watermark=None, stationStart=None, cancel=None):
+    # Vectorized merge: the station sheets are concatenated once, purchases and weigh-ins are stacked into event
+    # columns and sorting by (day, card) lines them up per member-day in the store.
+    # existing is an EventStore whose rows before startDate are kept, for incremental runs: only the days from startDate
+    # are merged, sorted and rolled up again, plus any earlier day whose station sheet (from stationStart, default
+    # startDate) no longer has the purchases stored for it, e.g. an export that arrived after its days were passed
+    import pandas as pd
+    first = startDate.toordinal()
+    last = endDate.toordinal()
+    station_first = (stationStart or startDate).toordinal()
+
+    sheets = {}
+    for day, df in station_data.items():
+        try:
+            ordinal = day_ordinal(day)
+        except ValueError: # Not a daily sheet
+            continue
+        if station_first <= ordinal <= last:
+            sheets[ordinal] = df
+
+    weights = weights[(weights['day'] >= first) & (weights['day'] <= last)]
+    profiles = dict(members)
+    if existing is not None:
+        keep = int(np.searchsorted(existing.day, first)) # Rows are sorted by day, only rows before startDate can stay
+        kept_day = np.asarray(existing.day[:keep])
+        kept_purchase = np.asarray(existing.station[:keep]) >= 0
+        stored_purchases = dict(zip(*(values.tolist() for values in np.unique(kept_day[kept_purchase], return_counts=True))))
+        late = sorted(ordinal for ordinal in stored_purchases.keys() | sheets.keys()
+                      if station_first <= ordinal < first and stored_purchases.get(ordinal, 0) != len(sheets.get(ordinal, ())))
+        redo = late[0] if late else first
+        unchanged = int(np.searchsorted(kept_day, redo)) # Rows of the days before any merged day, already in order
+        replaced = kept_purchase & np.isin(kept_day, late) # Stored purchases of the late days, their sheets replace them
+        kept = np.flatnonzero(~replaced[unchanged:]) + unchanged
+        stations = list(existing.stations)
+        profiles.update(existing.members) # Profiles already stored win, like the first-seen rule in merge_data
+        rollup = existing.rollup()
+        cube = rollup[0] if rollup is not None else None # Its rows of the unchanged days are reused
+    else:
+        late, unchanged, kept, cube = [], 0, np.empty(0, dtype=np.int64), None
+        stations = []
+
+    frames = [pd.DataFrame({'card': df['卡号'].astype('int64').to_numpy(), 'day': ordinal, 'name': df['POS机名称'].astype(object).fillna('Unknown').to_numpy()})
+              for ordinal, df in sheets.items() if len(df) and (existing is None or ordinal >= first or ordinal in late)]
+    purchases = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame({'card': [], 'day': [], 'name': []})
+    print(f"Merging {len(purchases)} purchases from {len(frames)} station sheets, keeping {unchanged + len(kept)} stored rows...")
+    for name in pd.unique(purchases['name']): # New station names get the next free codes
+        if name not in stations:
+            stations.append(name)
+    station_codes = pd.Categorical(purchases['name'], categories=stations).codes
+    check_cancel(cancel)
+
+    def stored(name, dtype): # The unchanged rows, then the other kept rows
+        if existing is None:
+            return [np.empty(0, dtype=dtype)]
+        column = getattr(existing, name)
+        return [np.asarray(column[:unchanged], dtype=dtype), np.asarray(column[kept], dtype=dtype)]
+    card = np.concatenate(stored('card', np.int64) + [purchases['card'].to_numpy(dtype=np.int64), weights['card'].to_numpy(dtype=np.int64)])
+    day = np.concatenate(stored('day', np.int32) + [purchases['day'].to_numpy(dtype=np.int32), weights['day'].to_numpy(dtype=np.int32)])
+    station = np.concatenate(stored('station', np.int16) + [station_codes.astype(np.int16), np.full(len(weights), -1, dtype=np.int16)])
+    weight = np.concatenate(stored('weight', np.float64) + [np.full(len(purchases), np.nan), weights['weight'].to_numpy(dtype=np.float64)])
+
+    write_store(dataFilename, card, day, station, weight, stations, profiles, watermark, lambda: check_cancel(cancel), unchanged, cube)
+    all_data = dataset.reload()
+    analysisCache.invalidate(all_data.version) # Analyses of the previous snapshot are stale
     return all_data
 
 def categorize_data(all_data):
@@ -298,103 +465,25 @@ def categorize_data(all_data):
     return categories, both_counter_weights
 
 def calculate_totals_and_daily_average_wastage(all_data, startDate, endDate):
-    counter_wastage = {}
-    counter_tally = {}
-    counter_purchases = {}
-    daily_counter_wastage = {}
-    counter_totals = {}
-    counter_counts = {}
-
-    for member, member_data in all_data.items(): # Iterate over the members in the data
-        for day, day_data in member_data.items(): # Iterate over the days for each member
-            if day in ['name', 'house', 'yeargroup', 'formclass', 'balance']:  # Skip non-day data
-                continue
-
-            day_date = datetime.strptime(day, "%Y-%m-%d").date() # Convert the date string to a date object
-            if day_date < startDate or day_date > endDate:  # Skip days outside the date range
-                continue
-
-            has_weights = 'weights' in day_data and day_data['weights'] # Check if the day data has weights and counters
-            has_counters = 'stations' in day_data and day_data['stations'] 
-
-            if has_weights and has_counters:
-                total_weight = sum(day_data['weights']) # Calculate the total wastage for the user on that day
-                weight_per_counter = total_weight / len(day_data['stations']) # Find average weight per counter, distributed evenly
-
-                for counter in day_data['stations']: # Iterate over the counters for the day
-                    if counter not in counter_wastage: # Initialize counter key in all the dictionaries if not present
-                        counter_wastage[counter] = 0
-                        counter_tally[counter] = 0
-                        counter_purchases[counter] = {}
-                        counter_totals[counter] = {}
-                        counter_counts[counter] = {}
-
-                    if day not in counter_purchases[counter]: # Then initialize day key in the nested dictionaries if not present
-                        counter_purchases[counter][day] = 0
-                        counter_totals[counter][day] = 0
-                        counter_counts[counter][day] = 0
-
-                    counter_wastage[counter] += weight_per_counter # Update data for all the dictionaries
-                    counter_tally[counter] += 1
-                    counter_purchases[counter][day] += 1
-                    counter_totals[counter][day] += weight_per_counter
-                    counter_counts[counter][day] += 1
-
-    average_wastage = {counter: total_wastage / counter_tally[counter] for counter, total_wastage in counter_wastage.items()} # Calculate average wastage for each counter
-
-    for counter, days in counter_totals.items(): # Calculate average wastage for each counter for each day
-        for day, total in days.items():
-            if counter not in daily_counter_wastage: # Initialize counter key in the daily wastage dictionary if not present
-                daily_counter_wastage[counter] = {}
-            daily_counter_wastage[counter][day] = total / counter_counts[counter][day]
-
-    return average_wastage, counter_wastage, counter_tally, counter_purchases, daily_counter_wastage
+    analysis = aggregate(all_data, startDate, endDate)
+    return analysis.average_wastage, analysis.counter_wastage, analysis.counter_tally, analysis.counter_purchases, analysis.daily_counter_wastage
 
 def get_last_date():
-    all_data = load_data()
     last_date = datetime.strptime('2024-01-01', '%Y-%m-%d')
-    for member, member_data in all_data.items():
-        for day, day_data in member_data.items():
-            if day in ['name', 'house', 'yeargroup', 'formclass', 'balance']:
-                continue
-            day_date = datetime.strptime(day, "%Y-%m-%d")
-            if day_date > last_date:
-                last_date = day_date
-    return last_date
-
-def cumulative_plot_waste(all_data, ax, startDate, endDate):
-    # Generate cumulative data for plotting
-    daily_counter_wastage = {}
-    for member, member_data in all_data.items():
-        for day, day_data in member_data.items():
-            if day in ['name', 'house', 'yeargroup', 'formclass', 'balance']:
-                continue
-            day_date = datetime.strptime(day, "%Y-%m-%d").date()
-            if day_date < startDate or day_date > endDate:
-                continue
-            has_weights = 'weights' in day_data and day_data['weights']
-            has_counters = 'stations' in day_data and day_data['stations']
-            if has_weights and has_counters:
-                total_weight = sum(day_data['weights'])
-                for counter in day_data['stations']:
-                    if counter not in daily_counter_wastage:
-                        daily_counter_wastage[counter] = {}
-                    if day not in daily_counter_wastage[counter]:
-                        daily_counter_wastage[counter][day] = 0
-                    daily_counter_wastage[counter][day] += total_weight
-
-    cumulative_counter_wastage = {}
-    for counter, daily_wastage in daily_counter_wastage.items():
-        cumulative_counter_wastage[counter] = {}
-        sorted_dates = sorted(daily_wastage.keys(), key=lambda date: datetime.strptime(date, '%Y-%m-%d'))
-        cumulative_total = 0
-        for date in sorted_dates:
-            cumulative_total += daily_wastage[date]
-            cumulative_counter_wastage[counter][date] = cumulative_total
-
-    for counter, daily_wastage in cumulative_counter_wastage.items():
-        sorted_dates = sorted(daily_wastage.keys(), key=lambda date: datetime.strptime(date, '%Y-%m-%d'))
-        sorted_wastages = [daily_wastage[date] for date in sorted_dates]
+    manifest = read_manifest(dataFilename) # Only the manifest is read, the data isn't opened
+    if manifest is not None:
+        last_day = manifest['last_day'] and date.fromisoformat(manifest['last_day'])
+    else: # Store written before manifests
+        last_day = dataset.get().last_day()
+    return max(last_date, datetime.combine(last_day, datetime.min.time())) if last_day else last_date
+
+def cumulative_plot_waste(analysis, ax):
+    # Running totals come straight from the prefix sums, plotted on the days each counter has data
+    import seaborn as sns
+    import matplotlib.dates as mdates
+    series = analysis.counter_waste
+    for counter in series.keys:
+        sorted_dates, sorted_wastages = series.running(counter)
         sns.lineplot(x=sorted_dates, y=sorted_wastages, ax=ax, label=counter)
 
     ax.set_title('Cumulative Food Waste Over Time', fontsize=16, color="white")
@@ -407,19 +496,11 @@ def cumulative_plot_waste(all_data, ax, startDate, endDate):
     ax.tick_params(axis='y', colors='white')
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
 
-def cumulative_plot_buys(counter_purchases, ax):
-    cumulative_counter_purchases = {}
-    for counter, daily_purchases in counter_purchases.items():
-        cumulative_counter_purchases[counter] = {}
-        sorted_dates = sorted(daily_purchases.keys(), key=lambda date: datetime.strptime(date, '%Y-%m-%d'))
-        cumulative_total = 0
-        for date in sorted_dates:
-            cumulative_total += daily_purchases[date]
-            cumulative_counter_purchases[counter][date] = cumulative_total
-
-    for counter, daily_purchases in cumulative_counter_purchases.items():
-        sorted_dates = sorted(daily_purchases.keys(), key=lambda date: datetime.strptime(date, '%Y-%m-%d'))
-        sorted_purchases = [daily_purchases[date] for date in sorted_dates]
+def cumulative_plot_buys(counter_buys, ax): # counter_buys is the analysis' DailySeries of purchases
+    import seaborn as sns
+    import matplotlib.dates as mdates
+    for counter in counter_buys.keys:
+        sorted_dates, sorted_purchases = counter_buys.running(counter)
         sns.lineplot(x=sorted_dates, y=sorted_purchases, ax=ax, label=counter)
 
     ax.set_title('Cumulative Purchases Over Time', fontsize=16, color="white")
@@ -433,6 +514,8 @@ def cumulative_plot_buys(counter_purchases, ax):
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
 
 def plot_counter_averages(daily_counter_wastage, ax):
+    import pandas as pd
+    import seaborn as sns
     averages = []
     counters = []
     for counter, daily_wastage in daily_counter_wastage.items():
@@ -453,7 +536,9 @@ def plot_counter_averages(daily_counter_wastage, ax):
     ax.tick_params(axis='x', colors='white')
     ax.tick_params(axis='y', colors='white')
 
-def spec_plot_weights(all_data, ax, ospec, start_date, end_date, cumulative, year_groups = []):
+def spec_plot_weights(analysis, ax, ospec, start_date, end_date, cumulative, year_groups = []):
+    import seaborn as sns
+    import matplotlib.dates as mdates
     house_colors = {
         'Owens': '#FFA500',      # Bright Orange
         'Soong': '#FF0000',      # Bright Red
@@ -465,38 +550,9 @@ def spec_plot_weights(all_data, ax, ospec, start_date, end_date, cumulative, yea
     # Define primary colors for non-house categories
     primary_colors = ['#FF5733', '#33FF57', '#3357FF', '#FF33A5', '#FFC300', '#33FFF9', '#C70039', '#900C3F', '#581845', '#2ECC71']
 
-    spec_wastage = {}
-    member_count = {}  # To count members contributing to each day's average
-
-    # Prepare data by member specification
-    for member, member_data in all_data.items():
-        if ospec == 'staff':
-            member_spec = 'Student' if member_data.get('yeargroup', '') != '' else 'Staff'
-        else:
-            member_spec = member_data.get(ospec)
-        
-        if not member_spec:
-            continue
-        if ospec == 'formclass' and member_data.get('yeargroup') not in year_groups:
-            continue
-        if member_spec not in spec_wastage:
-            spec_wastage[member_spec] = {}
-            member_count[member_spec] = {}
-
-        for day, day_data in member_data.items():
-            if day in ['name', 'house', 'yeargroup', 'formclass', 'balance']:
-                continue
-            day_date = datetime.strptime(day, "%Y-%m-%d").date()
-            if day_date < start_date or day_date > end_date:
-                continue
-            has_weights = 'weights' in day_data and day_data['weights']
-            if has_weights:
-                total_weight = sum(day_data['weights'])
-                if day not in spec_wastage[member_spec]:
-                    spec_wastage[member_spec][day] = 0
-                    member_count[member_spec][day] = 0
-                spec_wastage[member_spec][day] += total_weight
-                member_count[member_spec][day] += 1
+    if not isinstance(analysis, Analysis):
+        analysis = aggregate(analysis, start_date, end_date)
+    spec_wastage, member_count = analysis.spec_series(ospec, year_groups) # spec -> {day: grams}, spec -> {day: weighed members}
 
     # Extract all dates within the range that have data
     all_dates = sorted({date for spec_data in spec_wastage.values() for date in spec_data})
@@ -510,25 +566,23 @@ def spec_plot_weights(all_data, ax, ospec, start_date, end_date, cumulative, yea
         print(f"No data available for the specified date range ({start_date} to {end_date}).")
         return
 
+    if cumulative:
+        daily_series = analysis.spec_daily(ospec, year_groups) # Same specs and order as spec_wastage
+        data_days = daily_series.any_present() # Days any spec has data, i.e. all_dates
+
     # Calculate and plot cumulative or daily average values based on the `cumulative` flag
     color_index = 0  # To alternate colors for non-house specs
     for spec, daily_wastage in spec_wastage.items():
-        cumulative_spec_wastage = {}
-        cumulative_total = 0
         averaged_daily_wastage = []
 
         if cumulative:
-            # Compute cumulative wastage
-            for date in all_dates:
-                daily_wastage.setdefault(date, 0)
-                cumulative_total += daily_wastage[date]
-                cumulative_spec_wastage[date] = cumulative_total
-            sorted_wastage = [cumulative_spec_wastage[date] for date in all_dates]
+            # Cumulative wastage is the prefix sum, read on the days with data
+            sorted_wastage = daily_series.running(spec, data_days)[1]
         else:
             # Compute daily average wastage per member
-            for date in all_dates:
-                if date in daily_wastage and member_count[spec].get(date, 0) > 0:
-                    avg_wastage = daily_wastage[date] / member_count[spec][date]
+            for day in all_dates:
+                if day in daily_wastage and member_count[spec].get(day, 0) > 0:
+                    avg_wastage = daily_wastage[day] / member_count[spec][day]
                 else:
                     avg_wastage = 0
                 averaged_daily_wastage.append(avg_wastage)
@@ -570,7 +624,9 @@ def spec_plot_weights(all_data, ax, ospec, start_date, end_date, cumulative, yea
         for text in legend.get_texts():
             text.set_color("white")
 
-def plot_daily_average_wastage(all_data, ax, ospec, start_date, end_date, year_groups = []):
+def plot_daily_average_wastage(analysis, ax, ospec, start_date, end_date, year_groups = []):
+    import pandas as pd
+    import seaborn as sns
     house_colors = {
         'Owens': '#FFA500',      # Bright Orange
         'Soong': '#FF0000',      # Bright Red for Soong
@@ -584,44 +640,13 @@ def plot_daily_average_wastage(all_data, ax, ospec, start_date, end_date, year_g
                       '#C70039', '#900C3F', '#581845', '#FFD700', '#8A2BE2', '#7FFF00', '#D2691E', 
                       '#FF7F50', '#6495ED', '#DC143C', '#00FFFF']
     
-    daily_wastage = defaultdict(lambda: defaultdict(float))
+    if not isinstance(analysis, Analysis):
+        analysis = aggregate(analysis, start_date, end_date)
+    wastage_by_day, items_by_day = analysis.item_series(ospec, year_groups) # day -> {spec: grams}, day -> {spec: items}
+    daily_wastage = {date.fromisoformat(day): specs for day, specs in wastage_by_day.items()}
     daily_items = defaultdict(lambda: defaultdict(int))
-
-    # Prepare data by member specification
-    for member, member_data in all_data.items():
-        if ospec == 'staff':
-            email = member_data.get('balance', '')
-            if not email:
-                continue
-            if email.endswith('@stu.dulwich.org'):
-                member_spec = 'Student'
-            else: #email.endswith('@dulwich.org'):
-                member_spec = 'Staff'
-            
-        else:
-            member_spec = member_data.get(ospec)
-        
-        if not member_spec:
-            continue
-        
-        if ospec == 'formclass' and member_data.get('yeargroup') not in year_groups:
-            continue
-
-        for day, day_data in member_data.items():
-            if day in ['name', 'house', 'yeargroup', 'formclass', 'balance']:
-                continue
-            day_date = datetime.strptime(day, "%Y-%m-%d").date()
-            if day_date < start_date or day_date > end_date:
-                continue
-            
-            has_weights = 'weights' in day_data and day_data['weights']
-            if has_weights:
-                total_weight = sum(day_data['weights'])
-                daily_wastage[day_date][member_spec] += total_weight
-
-            # Count the number of items purchased by all members in the category
-            if 'stations' in day_data:
-                daily_items[day_date][member_spec] += len(day_data['stations'])
+    for day, specs in items_by_day.items():
+        daily_items[date.fromisoformat(day)].update(specs)
 
     staff_nums = {'2024-11-19': 337, '2024-11-20': 339}
     # Calculate daily average wastage per item
@@ -720,14 +745,15 @@ def rank_counters(average_wastage, total_wastage, counter_days): # Prints ranks
         print(f"{counter}: {days} buys")
 
 def analyze_data(all_data, startDate, endDate):
-    average_wastage, total_wastage, counter_tally, counter_purchases, daily_average_wastage = calculate_totals_and_daily_average_wastage(all_data, startDate, endDate)
-    #rank_counters(average_wastage, total_wastage, counter_tally)
-    metadata = [all_data, average_wastage, total_wastage, counter_tally, counter_purchases, daily_average_wastage] # Store all metadata in a list
-    return metadata
+    analysis = analysisCache.get(all_data, startDate, endDate) # Every plot's series in one pass over the date range, reused until the data changes
+    #rank_counters(analysis.average_wastage, analysis.counter_wastage, analysis.counter_tally)
+    return analysis
 
 
 
-def plot(startDate, endDate, plots, metadata, continuous, filename, year_groups = None): # plots and metadata are lists
+def plot(startDate, endDate, plots, analysis, continuous, filename, year_groups = None, show = True): # plots is a list, analysis comes from analyze_data
+    import matplotlib.pyplot as plt
+    plot_style()
     plt.close('all')  # Close all existing figures
 
     # Create a 1x3 grid of subplots. The returned object is a Figure instance (f) and an array of Axes objects (ax1, ax2, ax3)
@@ -737,128 +763,189 @@ def plot(startDate, endDate, plots, metadata, continuous, filename, year_groups
 
     for i, ax in enumerate(axes):
         if plots[i] == 'counters':
-            cumulative_plot_waste(metadata[0], ax, startDate, endDate) # all_data
+            cumulative_plot_waste(analysis, ax)
         elif plots[i] == 'buys':
-            cumulative_plot_buys(metadata[4], ax) # counter_purchases, date limited
+            cumulative_plot_buys(analysis.counter_buys, ax) # date limited
         elif plots[i] == 'counter_avg':
-            plot_counter_averages(metadata[5], ax) # daily_average_wastage, date limited
+            plot_counter_averages(analysis.daily_counter_wastage, ax) # date limited
         elif plots[i] == 'formclass':
-            spec_plot_weights(metadata[0], ax, plots[i], startDate, endDate, True, year_groups) # all_data
+            spec_plot_weights(analysis, ax, plots[i], startDate, endDate, True, year_groups)
         else:
-            spec_plot_weights(metadata[0], ax, plots[i], startDate, endDate, True) # all_data
+            spec_plot_weights(analysis, ax, plots[i], startDate, endDate, True)
 
     # Ensure the 'plots' folder exists
     os.makedirs('plots', exist_ok=True)
 
-    now = datetime.now()
-    timestamp = now.strftime('%Y%m%d_%H%M%S')
-
     filepath = f'plots/plot_{filename}.png'
     plt.savefig(filepath)
 
-    plt.show()
-
-def plot_fullscreen(startDate, endDate, plots, metadata, line, cumulative, year_groups):
-    plt.close('all')  # Close all existing figures
+    if show:
+        plt.show()
+    else: # Headless, the figure is only saved
+        plt.close(f)
+    return filepath
+
+def render_fullscreen(startDate, endDate, plot_type, analysis, line, cumulative, year_groups, glow=None):
+    # Renders one fullscreen figure to full_plots/ and returns its filename. Draws on a standalone Figure rather than
+    # pyplot, so it can run on a worker thread while Tk keeps the main one, or in a render process
+    from matplotlib.figure import Figure
+    from glow import add_glow
+    plot_style()
+
+    # Create a fullscreen 16:9 plot with enhanced styling
+    fig = Figure(figsize=fullscreenSize)
+    ax = fig.add_subplot()
+    fig.subplots_adjust(left=0.08, right=0.92, top=0.88, bottom=0.18)  # Increased bottom padding
     
-    # Ensure the 'full_plots' folder exists
-    os.makedirs('full_plots', exist_ok=True)
-
-    for plot_type in plots:
-        # Create a fullscreen 16:9 plot with enhanced styling
-        fig, ax = plt.subplots(figsize=(16, 9))
-        plt.subplots_adjust(left=0.08, right=0.92, top=0.88, bottom=0.18)  # Increased bottom padding
-        
+    x_label = "Date"
+    y_label = "Value"
+    
+    # Generate the plot based on the type by passing the ax and data to the specific functions
+    if plot_type == 'counters':
+        cumulative_plot_waste(analysis, ax)
+        x_label = "Date"
+        y_label = "Food Wastage (grams)"
+    elif plot_type == 'buys':
+        cumulative_plot_buys(analysis.counter_buys, ax)
         x_label = "Date"
-        y_label = "Value"
-        
-        # Generate the plot based on the type by passing the ax and data to the specific functions
-        if plot_type == 'counters':
-            cumulative_plot_waste(metadata[0], ax, startDate, endDate)
+        y_label = "Buys"
+    elif plot_type == 'counter_avg':
+        plot_counter_averages(analysis.daily_counter_wastage, ax)
+        x_label = "Station"
+        y_label = "Food Wastage (grams)"
+    elif plot_type in ['formclass', 'house', 'yeargroup', 'staff']:
+        if line:
+            spec_plot_weights(analysis, ax, plot_type, start_date=startDate, end_date=endDate, cumulative=cumulative, year_groups=year_groups)
             x_label = "Date"
             y_label = "Food Wastage (grams)"
-        elif plot_type == 'buys':
-            cumulative_plot_buys(metadata[4], ax)
+        else:
+            plot_daily_average_wastage(analysis, ax, plot_type, startDate, endDate)
             x_label = "Date"
-            y_label = "Buys"
-        elif plot_type == 'counter_avg':
-            plot_counter_averages(metadata[5], ax)
-            x_label = "Station"
             y_label = "Food Wastage (grams)"
-        elif plot_type in ['formclass', 'house', 'yeargroup', 'staff']:
-            if line:
-                spec_plot_weights(metadata[0], ax, plot_type, start_date=startDate, end_date=endDate, cumulative=cumulative, year_groups=year_groups)
-                x_label = "Date"
-                y_label = "Food Wastage (grams)"
-            else:
-                plot_daily_average_wastage(metadata[0], ax, plot_type, startDate, endDate)
-                x_label = "Date"
-                y_label = "Food Wastage (grams)"
-
-            if plot_type == 'yeargroup':
-                # Sort the legend for yeargroup numerically and apply consistent styling
-                handles, labels = ax.get_legend_handles_labels()
-                if labels:  # Check if labels exist
-                    sorted_legend = sorted(zip(labels, handles), key=lambda x: int(x[0]))
-                    labels, handles = zip(*sorted_legend)
-                    legend = ax.legend(handles, labels, loc='upper left', fontsize=14, frameon=True, facecolor='#333333', edgecolor='white')
-                    legend.set_title("Legend", prop={'size': 16, 'weight': 'bold'})
-                    legend.get_title().set_color("white")
-                    for text in legend.get_texts():
-                        text.set_color("white")
-        else:
-            spec_plot_weights(metadata[0], ax, plot_type, startDate, endDate, cumulative)
 
-        if line:
-            # Simulate a glow effect by layering lines with increasing opacity
-            for line in ax.get_lines():
-                line_color = line.get_color()  # Get the color of the primary line
-                rgba_color = to_rgba(line_color)
-
-                # Overlay multiple lines with decreasing opacity for glow
-                for alpha, lw in zip([0.05, 0.1, 0.2, 0.3], [12, 10, 8, 6]):
-                    ax.plot(line.get_xdata(), line.get_ydata(),
-                            color=(rgba_color[0], rgba_color[1], rgba_color[2], alpha),
-                            linewidth=lw, zorder=-1)
-
-        desc = '' # Over Time
-        year = f' (Year {year_groups[0]})' if plot_type == 'formclass' else ''
-        if line:   
-            if cumulative:
-                ax.set_title(f"{plot_type.title()} Cumulative Food Waste {desc}{year}", fontsize=22, color="white", weight='bold', pad=20)
-            else:
-                ax.set_title(f"{plot_type.title()} Average Food Waste {desc}{year}", fontsize=22, color="white", weight='bold', pad=20)
+        if plot_type == 'yeargroup':
+            # Sort the legend for yeargroup numerically and apply consistent styling
+            handles, labels = ax.get_legend_handles_labels()
+            if labels:  # Check if labels exist
+                sorted_legend = sorted(zip(labels, handles), key=lambda x: int(x[0]))
+                labels, handles = zip(*sorted_legend)
+                legend = ax.legend(handles, labels, loc='upper left', fontsize=14, frameon=True, facecolor='#333333', edgecolor='white')
+                legend.set_title("Legend", prop={'size': 16, 'weight': 'bold'})
+                legend.get_title().set_color("white")
+                for text in legend.get_texts():
+                    text.set_color("white")
+    else:
+        spec_plot_weights(analysis, ax, plot_type, startDate, endDate, cumulative)
+
+    if line:
+        add_glow(ax, glow or glowMode)
+
+    desc = '' # Over Time
+    year = f' (Year {year_groups[0]})' if plot_type == 'formclass' else ''
+    if line:   
+        if cumulative:
+            ax.set_title(f"{plot_type.title()} Cumulative Food Waste {desc}{year}", fontsize=22, color="white", weight='bold', pad=20)
         else:
-            ax.set_title(f"Student vs Staff Average Food Waste {desc}", fontsize=22, color="white", weight='bold', pad=20)
-            #ax.set_title(f"{plot_type.title()} Average Food Waste {desc}{year}", fontsize=22, color="white", weight='bold', pad=20)
-        ax.set_xlabel(x_label, fontsize=18, color="white", labelpad=15)
-        ax.set_ylabel(y_label, fontsize=18, color="white", labelpad=15)
-        
-        # Customize tick colors and font sizes to fit the theme
-        ax.tick_params(axis='x', colors='white', rotation=45, labelsize=14)
-        ax.tick_params(axis='y', colors='white', labelsize=14)
-
-        # Customize legend for larger size and white text if not already done
-        if plot_type != 'yeargroup' and ax.get_legend():
-            legend = ax.legend(loc='upper left', fontsize=14, frameon=True, facecolor='#333333', edgecolor='white')
-            legend.set_title("Legend", prop={'size': 16, 'weight': 'bold'})
-            legend.get_title().set_color("white")
-            for text in legend.get_texts():
-                text.set_color("white")
-        
-        # Save each plot individually with the plot type name
-        filename = f'full_plots/{plot_type}{year_groups[0] if plot_type == 'formclass' else ''}_{"line" if line else "bar"}_{"cumulative" if cumulative and line else "average"}.png'
-        plt.savefig(filename, dpi=300)  # High resolution for display quality
-        plt.close(fig)  # Close figure to free up memory
+            ax.set_title(f"{plot_type.title()} Average Food Waste {desc}{year}", fontsize=22, color="white", weight='bold', pad=20)
+    else:
+        ax.set_title(f"Student vs Staff Average Food Waste {desc}", fontsize=22, color="white", weight='bold', pad=20)
+        #ax.set_title(f"{plot_type.title()} Average Food Waste {desc}{year}", fontsize=22, color="white", weight='bold', pad=20)
+    ax.set_xlabel(x_label, fontsize=18, color="white", labelpad=15)
+    ax.set_ylabel(y_label, fontsize=18, color="white", labelpad=15)
+    
+    # Customize tick colors and font sizes to fit the theme
+    ax.tick_params(axis='x', colors='white', rotation=45, labelsize=14)
+    ax.tick_params(axis='y', colors='white', labelsize=14)
 
+    # Customize legend for larger size and white text if not already done
+    if plot_type != 'yeargroup' and ax.get_legend():
+        legend = ax.legend(loc='upper left', fontsize=14, frameon=True, facecolor='#333333', edgecolor='white')
+        legend.set_title("Legend", prop={'size': 16, 'weight': 'bold'})
+        legend.get_title().set_color("white")
+        for text in legend.get_texts():
+            text.set_color("white")
+    
+    # Save each plot individually with the plot type name
+    filename = fullscreen_filename(plot_type, line, cumulative, year_groups)
+    fig.savefig(filename, dpi=fullscreenDpi)  # High resolution for display quality
+    return filename
+
+def fullscreen_filename(plot_type, line, cumulative, year_groups):
+    return f'full_plots/{plot_type}{year_groups[0] if plot_type == 'formclass' else ''}_{"line" if line else "bar"}_{"cumulative" if cumulative and line else "average"}.png'
+
+def figure_key(analysis, plot_type, line, cumulative, year_groups, glow):
+    # Render cache key: the series the figure draws plus everything else that changes its pixels
+    if plot_type == 'counters':
+        series = analysis.counter_daily_totals
+    elif plot_type == 'buys':
+        series = analysis.counter_purchases
+    elif plot_type == 'counter_avg':
+        series = analysis.daily_counter_wastage
+    elif plot_type in ['formclass', 'house', 'yeargroup', 'staff']:
+        series = analysis.spec_series(plot_type, year_groups) if line else analysis.item_series(plot_type)
+    else:
+        series = analysis
+    settings = (renderVersion, version('matplotlib'), version('seaborn'), fullscreenSize, fullscreenDpi) # Without importing either, a fully cached run never does
+    glow = glow if line else None # Bar figures get no glow, switching modes keeps them cached
+    return render_key('fullscreen', settings, plot_type, bool(line), bool(cumulative), list(year_groups or []), glow, series)
+
+def init_render_worker(analysis):
+    # Runs once in each render process: no GUI backend, and the analysis is unpickled once per process, not per figure
+    global renderAnalysis
+    import matplotlib
+    matplotlib.use('Agg')
+    renderAnalysis = analysis
+
+def render_worker_figure(startDate, endDate, plot_type, line, cumulative, year_groups, glow):
+    return render_fullscreen(startDate, endDate, plot_type, renderAnalysis, line, cumulative, year_groups, glow)
+
+def render_many(startDate, endDate, figures, analysis, workers=None, progress=None, cancel=None, glow=None):
+    # Renders (plot_type, line, cumulative, year_groups) figures, across a process pool when workers > 1.
+    # Figures found in the render cache are copied instead. Returns the filenames in figures order
+    workers = workers or renderWorkers
+    glow = glow or glowMode # Resolved here, render processes don't see changes to the global
+    os.makedirs('full_plots', exist_ok=True) # Ensure the 'full_plots' folder exists
+
+    filenames = [fullscreen_filename(*figure) for figure in figures]
+    keys = [figure_key(analysis, *figure, glow) for figure in figures]
+    pending = [i for i in range(len(figures)) if not fetch_render(keys[i], filenames[i])]
+    if len(pending) < len(figures):
+        print(f"Reused {len(figures) - len(pending)} unchanged plots from the render cache.")
+
+    if workers <= 1 or len(pending) <= 1:
+        for i in pending:
+            plot_type, line, cumulative, year_groups = figures[i]
+            check_cancel(cancel)
+            if progress is not None:
+                progress(f"Rendering {plot_type} ({'line' if line else 'bar'})...")
+            render_fullscreen(startDate, endDate, plot_type, analysis, line, cumulative, year_groups, glow)
+            store_render(keys[i], filenames[i])
+        return filenames
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=init_render_worker, initargs=(analysis,)) as executor:
+        futures = {executor.submit(render_worker_figure, startDate, endDate, *figures[i], glow): i for i in pending}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                store_render(keys[futures[future]], filenames[futures[future]])
+                check_cancel(cancel)
+                if progress is not None:
+                    progress(f"Rendered {done} of {len(pending)} plots...")
+        finally:
+            for future in futures: # Nothing left to wait for after a cancel or a failed figure
+                future.cancel()
+    return filenames
+
+def plot_fullscreen(startDate, endDate, plots, analysis, line, cumulative, year_groups, progress=None, cancel=None, workers=1, glow=None):
+    render_many(startDate, endDate, [(plot_type, line, cumulative, year_groups) for plot_type in plots], analysis, workers, progress, cancel, glow)
     print("All plots have been saved in the 'full_plots' folder.")
 
-def test(startDateStr, endDateStr):
+def test(startDateStr, endDateStr, progress=None, cancel=None):
     #current_date = getDate()
     startDate = datetime.strptime(startDateStr, '%Y-%m-%d').date()
     endDate = datetime.strptime(endDateStr, '%Y-%m-%d').date()
     #all_data = report()
-    all_data = load_data() # Load data from JSON file
+    all_data = dataset.get() # Shared with the app, opened once per snapshot
     
     categories, both_counter_weights = categorize_data(all_data)
     for category, count in categories.items():
@@ -872,34 +959,40 @@ def test(startDateStr, endDateStr):
     print("\n")
     
 
-    metadata = analyze_data(all_data, startDate, endDate)
-    run = 2
+    render_tv(startDate, endDate, progress, cancel, all_data)
+
+def render_tv(startDate, endDate, progress=None, cancel=None, all_data=None, workers=None, glow=None):
+    # The 18 fullscreen figures for the TV screens, without test()'s data diagnostics
+    all_data = all_data if all_data is not None else dataset.get()
+    analysis = analyze_data(all_data, startDate, endDate)
     ''']
     # STUDENT SIDE
     plots = ['counters', 'yeargroup', 'house']
-    plot(startDate, endDate, plots, metadata, True, f"stu_continous{run}")
-    plot(startDate, endDate, plots, metadata, False, f"stu_discrete{run}")
+    plot(startDate, endDate, plots, analysis, True, f"stu_continous{run}")
+    plot(startDate, endDate, plots, analysis, False, f"stu_discrete{run}")
     # SODEXO SIDE
     plots = ['counters', 'buys', 'counter_avg']
-    plot(startDate, endDate, plots, metadata, True, f"sod_continous{run}")
-    plot(startDate, endDate, plots, metadata, False, f"sod_discrete{run}")
+    plot(startDate, endDate, plots, analysis, True, f"sod_continous{run}")
+    plot(startDate, endDate, plots, analysis, False, f"sod_discrete{run}")
     '''
 
     plots = ['counters', 'yeargroup', 'house', 'formclass', 'buys', 'counter_avg']
     #plots = ['staff']
     year_groups = ['9', '10', '11', '12', '13']
 
-    plot_fullscreen(startDate, endDate, plots, metadata, True, True, year_groups) # Line? Cumulative? 
-    plot_fullscreen(startDate, endDate, plots, metadata, True, False, year_groups)
-    plot_fullscreen(startDate, endDate, plots, metadata, False, False, year_groups)
+    # Line? Cumulative? All 18 figures are independent, so they are rendered together across the render processes
+    figures = [(plot_type, line, cumulative, year_groups) for line, cumulative in [(True, True), (True, False), (False, False)] for plot_type in plots]
+    filenames = render_many(startDate, endDate, figures, analysis, workers or renderWorkers, progress, cancel, glow)
+    print("All plots have been saved in the 'full_plots' folder.")
+    return filenames
 
     '''plots = ['formclass']
     
     for year_group in year_groups:
         year_list = [year_group]
-        plot_fullscreen(startDate, endDate, plots, metadata, True, False, year_list)
-        plot_fullscreen(startDate, endDate, plots, metadata, True, True, year_list)
-        plot_fullscreen(startDate, endDate, plots, metadata, False, False, year_list)
+        plot_fullscreen(startDate, endDate, plots, analysis, True, False, year_list)
+        plot_fullscreen(startDate, endDate, plots, analysis, True, True, year_list)
+        plot_fullscreen(startDate, endDate, plots, analysis, False, False, year_list)
     '''
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import matplotlib
+matplotlib.use('Agg') # Before main imports pyplot: no display, no Tk, and nothing is ever shown
+
+import main
+from glow import glowModes
+
+# Headless batch rendering for cron jobs on a server without a display: writes the plots and exits.
+# Usage: python render.py --preset TV                                     (last 7 days of data to full_plots/)
+#        python render.py --preset TV --start 2024-11-10 --end 2024-11-20
+#        python render.py --preset Student --discrete --regenerate        (fetch new records first, plots/ as in the app)
+
+presets = {
+    'TV': None, # The 18 fullscreen figures of main.render_tv
+    'Student': ['yeargroup', 'house', 'formclass'],
+    'Sodexo': ['counters', 'buys', 'counter_avg'],
+    'All': ['counters', 'buys', 'counter_avg', 'yeargroup', 'house', 'formclass'],
+}
+
+def parse_date(value):
+    return date.fromisoformat(value)
+
+def date_range(args):
+    # --end defaults to the last day with data (from the manifest), --start to --days before it
+    endDate = args.end or main.get_last_date().date()
+    startDate = args.start or endDate - timedelta(days=args.days - 1)
+    return startDate, endDate
+
+def render(args):
+    if (args.regenerate or args.full) and main.report(incremental=not args.full) is None:
+        print("Regenerate failed, rendering the existing data.")
+
+    if not main.is_store(main.dataFilename) and not os.path.exists(main.legacyDataFilename):
+        print(f"No data in {main.dataFilename}, run with --regenerate first.")
+        return 1
+
+    startDate, endDate = date_range(args)
+    if startDate > endDate:
+        print("Start date cannot be greater than end date.")
+        return 1
+    all_data = main.dataset.get()
+    first, last = all_data.rows_between(startDate, endDate)
+    if first == last: # Nothing would be drawn, a cron job should see that as a failure
+        print(f"No events between {startDate} and {endDate}.")
+        return 1
+    print(f"Rendering {args.preset} plots for {startDate} to {endDate}")
+
+    if args.preset == 'TV':
+        filenames = main.render_tv(startDate, endDate, all_data=all_data, workers=args.workers, glow=args.glow)
+    else:
+        plots = args.plots or presets[args.preset]
+        analysis = main.analyze_data(all_data, startDate, endDate)
+        filenames = [main.plot(startDate, endDate, plots, analysis, not args.discrete, args.filename, args.year_groups, show=False)]
+    for filename in filenames:
+        print(filename)
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the FoodBot plots without the app or a display")
+    parser.add_argument('--preset', choices=list(presets), default='TV')
+    parser.add_argument('--plots', nargs='+', choices=presets['All'], help="Custom plots instead of the preset's (not for TV)")
+    parser.add_argument('--start', type=parse_date, help="YYYY-MM-DD, defaults to --days before --end")
+    parser.add_argument('--end', type=parse_date, help="YYYY-MM-DD, defaults to the last day with data")
+    parser.add_argument('--days', type=int, default=7, help="Days to show when --start isn't given")
+    parser.add_argument('--year-groups', nargs='+', default=['9', '10', '11', '12', '13'], help="Year groups for the formclass plot (not for TV)")
+    parser.add_argument('--discrete', action='store_true', help="Daily instead of cumulative lines (not for TV)")
+    parser.add_argument('--filename', default='render_output', help="Saved as plots/plot_<filename>.png (not for TV)")
+    parser.add_argument('--workers', type=int, default=None, help="Render processes for TV, defaults to all cores")
+    parser.add_argument('--glow', choices=glowModes, default=None, help="Line glow for TV, defaults to main.glowMode")
+    parser.add_argument('--regenerate', action='store_true', help="Fetch new records and merge them before rendering")
+    parser.add_argument('--full', action='store_true', help="Regenerate from scratch: refetch every record instead of from the watermark")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    status = render(args)
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+    sys.exit(status)
@@ -0,0 +1,39 @@
+import hashlib
+import os
+import pickle
+import shutil
+
+# Content-addressed cache of rendered figures: a PNG is stored under the hash of everything that decides its
+# pixels (the series drawn, plot type, style flags, figure settings), so an unchanged figure is copied
+# instead of rendered again.
+
+renderCacheDirectory = 'cache/renders'
+renderCacheSize = 200 # PNGs kept, the least recently used are removed first
+
+def render_key(*parts):
+    return hashlib.sha256(pickle.dumps(parts, protocol=4)).hexdigest()
+
+def cache_path(key):
+    return os.path.join(renderCacheDirectory, f'{key}.png')
+
+def fetch_render(key, filename):
+    # Puts the cached render for key at filename, False when it has to be rendered
+    path = cache_path(key)
+    if not os.path.exists(path):
+        return False
+    os.utime(path) # Recently used
+    shutil.copyfile(path, filename)
+    return True
+
+def store_render(key, filename):
+    os.makedirs(renderCacheDirectory, exist_ok=True)
+    tmp_path = cache_path(key) + '.tmp'
+    shutil.copyfile(filename, tmp_path)
+    os.replace(tmp_path, cache_path(key))
+    prune()
+
+def prune(size=None):
+    size = size or renderCacheSize
+    entries = sorted((entry for entry in os.scandir(renderCacheDirectory) if entry.name.endswith('.png')), key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:max(len(entries) - size, 0)]:
+        os.remove(entry.path)
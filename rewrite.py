@@ -1,94 +1,167 @@
+import argparse
+import glob
 import os
 import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from main import convert_api_id, load_conversion_dicts
+from conversion import load_conversion_index
 import pandas as pd
+from openpyxl import Workbook
 
 # Function to convert date string from "Month Day" to "YYYY-MM-DD"
-def convert_date_string(date_str):
+def convert_date_string(date_str, year=2024):
     try:
         # Parse the date string to a datetime object
         date_obj = datetime.strptime(date_str, "%b %d")
         # Set the correct year
-        date_obj = date_obj.replace(year=2024)
+        date_obj = date_obj.replace(year=year)
         # Convert to the desired format
         return date_obj.strftime("%Y-%m-%d")
     except ValueError:
         return None
+
+def single_day_date(filename):
+    # 'May 13' from "餐线消费数据-May 13.xlsx", None for any other filename, e.g. a monthly export
+    match = re.match(r"餐线消费数据-(\w+ \d+).xlsx", filename)
+    return match.group(1) if match else None
+
+def rename_file(file_path, year=2024):
+    # Renames "餐线消费数据-May 13.xlsx" to "餐线消费数据-2024-05-13.xlsx", returns the path the file ends up at
+    folder_path, filename = os.path.split(file_path)
+    # Extract the date part from a filename like "餐线消费数据-May 13.xlsx"
+    date_part = single_day_date(filename)
+    if date_part:
+        # Convert the date part to the desired format
+        new_date_part = convert_date_string(date_part, year)
+        if new_date_part:
+            # Create the new filename
+            new_filename = f"餐线消费数据-{new_date_part}.xlsx"
+            new_file_path = os.path.join(folder_path, new_filename)
+            
+            # Check if the new filename already exists
+            if not os.path.exists(new_file_path):
+                # Rename the file
+                os.rename(file_path, new_file_path)
+                print(f"Renamed: {filename} -> {new_filename}")
+                return new_file_path
+            else:
+                print(f"File {new_filename} already exists. Skipping renaming {filename}.")
+        else:
+            print(f"Failed to convert date for file: {filename}")
+    else:
+        print(f"Filename does not match pattern: {filename}")
+    return file_path
+
 def rename_files(folder_path):
     # Iterate over all files in the folder
     for filename in os.listdir(folder_path):
-        # Check if the filename matches the pattern "餐线消费数据-May 13.xlsx"
-        match = re.match(r"餐线消费数据-(\w+ \d+).xlsx", filename)
-        if match:
-            # Extract the date part from the filename
-            date_part = match.group(1)
-            # Convert the date part to the desired format
-            new_date_part = convert_date_string(date_part)
-            if new_date_part:
-                # Create the new filename
-                new_filename = f"餐线消费数据-{new_date_part}.xlsx"
-                # Get the full file paths
-                old_file_path = os.path.join(folder_path, filename)
-                new_file_path = os.path.join(folder_path, new_filename)
-                
-                # Check if the new filename already exists
-                if not os.path.exists(new_file_path):
-                    # Rename the file
-                    os.rename(old_file_path, new_file_path)
-                    print(f"Renamed: {filename} -> {new_filename}")
-                else:
-                    print(f"File {new_filename} already exists. Skipping renaming {filename}.")
-            else:
-                print(f"Failed to convert date for file: {filename}")
-        else:
-            print(f"Filename does not match pattern: {filename}")
+        rename_file(os.path.join(folder_path, filename))
 
     print("Renaming completed.")
 
-def convert_ids_in_excel(writer, file_path, sheet_name):
-    # Load the Excel file
-    xls = pd.ExcelFile(file_path)
+def convert_id_column(column, conversion_index):
+    # Converts a whole column (卡号 -> 会员编号) with one binary search over the conversion index, unmatched IDs become 'No Match'
+    converted = conversion_index.convert_many(column, reverse=True, missing='No Match')
+    return pd.Series(converted, index=column.index, dtype=object), int((converted == 'No Match').sum())
+
+def write_sheet(workbook, sheet_name, df):
+    # Appends the frame to a write-only workbook, which streams the rows to a temporary file instead of keeping cells
+    worksheet = workbook.create_sheet(sheet_name)
+    worksheet.append(list(df.columns))
+    for row in df.astype(object).where(df.notna(), None).itertuples(index=False): # Empty cells stay empty
+        worksheet.append(row)
 
-    # Check if the sheet exists
-    if sheet_name in xls.sheet_names:
+def convert_ids_in_excel(workbook, xls, sheet_name, conversion_index, verbose=True):
+    # xls is an already open pd.ExcelFile, so the workbook isn't reopened for every sheet
+    if verbose:
         print(f"Processing sheet: {sheet_name}")
-        df = pd.read_excel(xls, sheet_name)
-
-        # Check if the "会员编号" column exists
-        if "会员编号" in df.columns:
-            no_matches = 0
-            # Replace the values in the "会员编号" column
-            for i in range(len(df["会员编号"])):
-                api_id = df.loc[i, "会员编号"]
-                if api_id is not None:
-                    converted_id = convert_api_id(reverse_conversion_dict, api_id)
-                    if converted_id:
-                        df.loc[i, "会员编号"] = converted_id
-                    else:
-                        df.loc[i, "会员编号"] = 'No Match'
-                        no_matches += 1
-                else:
-                    print(f"Warning: api_id is None for index {i}")
+    df = pd.read_excel(xls, sheet_name)
 
+    # Check if the "会员编号" column exists
+    if "会员编号" in df.columns:
+        df["会员编号"], no_matches = convert_id_column(df["会员编号"], conversion_index)
+        if verbose:
             print(f"No matches / total IDs: {no_matches} / {len(df['会员编号'])}")
 
-            # Extract the original file name without extension
-            original_file_name = os.path.splitext(file_path)[0]
-
-            # Create a new file name by appending "_new" to the original file name
-            new_file_name = original_file_name + "_new.xlsx"
-            
-            # Write the modified DataFrame to the Excel file
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-        else:
-            print(f"Sheet '{sheet_name}' does not contain '会员编号' column.")
+        # Write the modified DataFrame to the Excel file
+        write_sheet(workbook, sheet_name, df)
+        return no_matches, len(df)
     else:
-        print(f"Sheet '{sheet_name}' does not exist in the Excel file.")
+        print(f"Sheet '{sheet_name}' does not contain '会员编号' column.")
+        return 0, 0
+
+def convert_ids_in_workbook(file_path, conversion_index, verbose=True):
+    # Opens the workbook once and streams each converted sheet into <name>_new.xlsx as soon as it is done,
+    # so only the sheet being converted is held in memory
+    new_file_name = os.path.splitext(file_path)[0] + "_new.xlsx"
+    no_matches = total = 0
+    workbook = Workbook(write_only=True)
+    with pd.ExcelFile(file_path) as xls:
+        for sheet_name in xls.sheet_names:
+            sheet_no_matches, sheet_total = convert_ids_in_excel(workbook, xls, sheet_name, conversion_index, verbose)
+            no_matches += sheet_no_matches
+            total += sheet_total
+    workbook.save(new_file_name)
+    return new_file_name, no_matches, total
+
+def process_workbook(file_path, conversion_index, rename=True, year=2024):
+    # One batch job: rename a single-day export to its YYYY-MM-DD name, then convert its IDs
+    start = time.perf_counter()
+    if rename:
+        file_path = rename_file(file_path, year)
+    new_file_name, no_matches, total = convert_ids_in_workbook(file_path, conversion_index, verbose=False)
+    return file_path, new_file_name, no_matches, total, time.perf_counter() - start
+
+def find_workbooks(paths):
+    # Directories are searched for POS exports, anything else is treated as a glob. Converted outputs are skipped
+    file_paths = set()
+    for path in paths:
+        pattern = os.path.join(path, "餐线消费数据-*.xlsx") if os.path.isdir(path) else path
+        for file_path in glob.glob(pattern):
+            filename = os.path.basename(file_path)
+            if not filename.endswith("_new.xlsx") and not filename.startswith("~$"):
+                file_paths.add(file_path)
+    return sorted(file_paths)
+
+def convert_workbooks(file_paths, conversion_index, workers=None, rename=True, year=2024):
+    # Converts every workbook on a process pool and prints a summary line per file, in input order
+    start = time.perf_counter()
+    renames = [rename and single_day_date(os.path.basename(file_path)) is not None for file_path in file_paths]
+    if rename and not all(renames): # Once for the batch, monthly exports are expected here
+        print(f"{renames.count(False)} workbooks aren't single-day exports and keep their names.")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(process_workbook, file_path, conversion_index, file_rename, year) for file_path, file_rename in zip(file_paths, renames)]
+        results = []
+        for file_path, future in zip(file_paths, futures):
+            try:
+                results.append(future.result())
+            except Exception as e: # One broken export shouldn't stop the backfill
+                print(f"Failed to convert {file_path}: {e}")
+
+    total_rows = 0
+    for file_path, new_file_name, no_matches, total, seconds in results:
+        total_rows += total
+        print(f"{os.path.basename(new_file_name)}: {total} IDs, {no_matches} no match, {seconds:.1f}s ({total / seconds:,.0f} rows/s)")
+    elapsed = time.perf_counter() - start
+    print(f"Converted {len(results)} / {len(file_paths)} workbooks, {total_rows} IDs in {elapsed:.1f}s ({total_rows / elapsed:,.0f} rows/s)")
+    return results
+
+if __name__ == "__main__":
+    # Usage: python rewrite.py data/                        (every export in a folder)
+    #        python rewrite.py "data/餐线消费数据-*.xlsx" --workers 8
+    parser = argparse.ArgumentParser(description="Rename POS exports and convert their 会员编号 IDs, one workbook per process")
+    parser.add_argument('paths', nargs='+', help="Folders of exports or glob patterns")
+    parser.add_argument('--workers', type=int, default=None, help="Processes to use, defaults to all cores")
+    parser.add_argument('--no-rename', action='store_true', help="Leave single-day export filenames as they are")
+    parser.add_argument('--year', type=int, default=2024, help="Year of single-day exports named like 'May 13'")
+    args = parser.parse_args()
 
-#rename_files("data")
-conversion_dict, reverse_conversion_dict = load_conversion_dicts()
+    file_paths = find_workbooks(args.paths)
+    if not file_paths:
+        print("No workbooks found.")
+        sys.exit(1)
 
-with pd.ExcelWriter("data/餐线消费数据-Sep_new.xlsx", engine='openpyxl') as writer:
-    for i in range(1, 32):
-        convert_ids_in_excel(writer, f"data/餐线消费数据-Sep.xlsx", f"Sep {i}")
\ No newline at end of file
+    conversion_index = load_conversion_index() # Rebuilt first if conversion.xls changed
+    convert_workbooks(file_paths, conversion_index, args.workers, not args.no_rename, args.year)
@@ -0,0 +1,154 @@
+import numpy as np
+
+import os
+import pickle
+
+# Daily rollup cube written into the event store with every snapshot: one row per
+# day x counter x house x yeargroup x formclass x role, so analyses cost the number of days and categories,
+# not the number of members. counter is '' on the rows that total a member-day over all counters:
+#   grams              weighed grams (on counter rows split evenly over the member-day's purchases)
+#   gross_grams        on counter rows, the full member-day grams once per purchase there
+#   weighins           weigh-ins (on counter rows, of the members who bought there)
+#   purchases          POS purchases
+#   weighed_purchases  purchases on member-days that have weigh-ins
+#   members            distinct members
+#   weighed_members    distinct members with weigh-ins
+# Members without a profile have '' for every category, role is '' for members without an email.
+# pandas is only imported to build the cube, opening a store (and the app) doesn't need it until the cube is unpickled.
+
+dimensions = ['day', 'counter', 'house', 'yeargroup', 'formclass', 'role']
+measures = ['grams', 'gross_grams', 'weighins', 'purchases', 'weighed_purchases', 'members', 'weighed_members']
+categories = ['house', 'yeargroup', 'formclass', 'role']
+rollupFilename = 'rollup.pkl'
+
+specNames = ['house', 'yeargroup', 'formclass', 'staff'] # Member attributes the spec plots group by
+
+def line_spec(profile, ospec):
+    # Group used by the spec line plots, formclass is kept together with its yeargroup so year filters can be applied later
+    if ospec == 'staff':
+        return 'Student' if profile.get('yeargroup', '') != '' else 'Staff'
+    if ospec == 'formclass':
+        return (profile.get('yeargroup'), profile['formclass']) if profile.get('formclass') else None
+    return profile.get(ospec)
+
+def member_role(profile):
+    # Student or Staff by school email, '' when there is none
+    email = profile.get('balance', '')
+    if not email:
+        return ''
+    return 'Student' if email.endswith('@stu.dulwich.org') else 'Staff'
+
+def item_spec(profile, ospec):
+    # Group used by the per-item bar plots, where staff and students are told apart by their email
+    if ospec == 'staff':
+        return member_role(profile) or None
+    return line_spec(profile, ospec)
+
+def profile_order(card, members):
+    # Cards in the order EventStore iterates them: cards with events ascending, then profile-only members
+    cards = np.unique(card).tolist()
+    seen = set(cards)
+    return cards + [member for member in members if member not in seen]
+
+def spec_order(card, members):
+    # ospec -> every spec in member order, so series keep a stable order even for specs without data in range
+    specs = {ospec: [] for ospec in specNames}
+    seen = {ospec: set() for ospec in specNames}
+    for member in profile_order(card, members):
+        profile = members.get(member, {})
+        for ospec in specNames:
+            spec = line_spec(profile, ospec)
+            if spec and spec not in seen[ospec]:
+                seen[ospec].add(spec)
+                specs[ospec].append(spec)
+    return specs
+
+def profile_frame(cards, members):
+    import pandas as pd
+    profiles = [members.get(card, {}) for card in cards]
+    frame = {'card': cards}
+    for key in ['house', 'yeargroup', 'formclass']:
+        frame[key] = [profile.get(key) if profile else '' for profile in profiles]
+    frame['role'] = [member_role(profile) for profile in profiles]
+    return pd.DataFrame(frame)
+
+def build_rollup(card, day, station, weight, stations, members):
+    import pandas as pd
+    if len(card) == 0:
+        return pd.DataFrame(columns=dimensions + measures)
+
+    events = pd.DataFrame({'card': card, 'day': day, 'station': station, 'weight': weight})
+    events['weighin'] = events['station'] < 0
+    events['purchase'] = ~events['weighin']
+
+    # Member-day totals over all counters
+    member_days = events.groupby(['day', 'card'], sort=False).agg(grams=('weight', 'sum'), weighins=('weighin', 'sum'), purchases=('purchase', 'sum')).reset_index()
+    weighed = member_days['weighins'] > 0
+    member_days['counter'] = ''
+    member_days['gross_grams'] = member_days['grams']
+    member_days['weighed_purchases'] = np.where(weighed, member_days['purchases'], 0)
+    member_days['members'] = 1
+    member_days['weighed_members'] = weighed.astype(np.int64)
+
+    # Per counter, each member-day's grams are split evenly over its purchases
+    bought = events[events['purchase']].groupby(['day', 'card', 'station'], sort=False).size().rename('purchases').reset_index()
+    day_totals = member_days[['day', 'card', 'grams', 'weighins', 'purchases']].rename(columns={'grams': 'day_grams', 'purchases': 'day_purchases'})
+    bought = bought.merge(day_totals, on=['day', 'card'], how='left')
+    weighed = bought['weighins'] > 0
+    bought['counter'] = np.asarray(stations, dtype=object)[bought['station'].to_numpy()] if len(bought) else ''
+    bought['grams'] = np.where(weighed, bought['day_grams'] / bought['day_purchases'] * bought['purchases'], 0.0)
+    bought['gross_grams'] = np.where(weighed, bought['day_grams'] * bought['purchases'], 0.0)
+    bought['weighed_purchases'] = np.where(weighed, bought['purchases'], 0)
+    bought['members'] = 1
+    bought['weighed_members'] = weighed.astype(np.int64)
+
+    rows = pd.concat([member_days[['day', 'card', 'counter'] + measures], bought[['day', 'card', 'counter'] + measures]], ignore_index=True)
+    profiles = profile_frame(pd.unique(rows['card']).tolist(), members)
+    rows = rows.merge(profiles, on='card', how='left')
+
+    cube = rows.groupby(dimensions, sort=False, dropna=False)[measures].sum().reset_index()
+    cube = cube.sort_values('day', kind='stable', ignore_index=True)
+    for key in categories: # A profile's missing values come back as NaN from the groupby
+        cube[key] = cube[key].astype(object).where(cube[key].notna(), None)
+    return cube
+
+def write_rollup(path, card, day, station, weight, stations, members, snapshot=None, sorted_rows=0, cube=None):
+    # snapshot is the id of the manifest written with it, a reader checks it against the columns it has open.
+    # With the previous snapshot's cube, the days of the first sorted_rows rows (whole days, unchanged since that
+    # snapshot) keep their cube rows and only the days after them are rolled up
+    if cube is not None and sorted_rows:
+        import pandas as pd
+        kept = cube[cube['day'] <= day[sorted_rows - 1]]
+        rolled = build_rollup(card[sorted_rows:], day[sorted_rows:], station[sorted_rows:], weight[sorted_rows:], stations, members)
+        cube = pd.concat([kept, rolled], ignore_index=True) if len(rolled) else kept.reset_index(drop=True)
+    else:
+        cube = build_rollup(card, day, station, weight, stations, members)
+    rollup = {'cube': cube, 'specs': spec_order(card, members), 'snapshot': snapshot}
+    with open(os.path.join(path, rollupFilename), 'wb') as f:
+        pickle.dump(rollup, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_rollup(path):
+    # Returns (cube, specs, snapshot id), or None for a store written before the rollup existed.
+    # Rollups written before the id was stored have None for it
+    file_path = os.path.join(path, rollupFilename)
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'rb') as f:
+        rollup = pickle.load(f)
+    return rollup['cube'], rollup['specs'], rollup.get('snapshot')
+
+def rows_between(cube, startDate, endDate):
+    # Rows are sorted by day, so a date range is one slice
+    days = cube['day'].to_numpy()
+    start = np.searchsorted(days, startDate.toordinal(), side='left')
+    end = np.searchsorted(days, endDate.toordinal(), side='right')
+    return cube.iloc[start:end]
+
+def totals(cube, by, startDate=None, endDate=None, counters=True):
+    # Sums the measures over everything but `by` (a list of dimensions). counters=False keeps the member-day totals
+    # rows instead of the per-counter rows, rows come out sorted by `by` like the analysis' counters.
+    # e.g. totals(cube, ['house'], start, end, counters=False)['grams']
+    if startDate is not None:
+        cube = rows_between(cube, startDate, endDate)
+    cube = cube[cube['counter'] != ''] if counters else cube[cube['counter'] == '']
+    return cube.groupby(by, dropna=False)[measures].sum()
@@ -0,0 +1,67 @@
+import numpy as np
+
+from store import day_ordinal, day_string
+
+# Dense per-day series: one row per key (counter, spec...), one column per day of the analysed range.
+# Running totals are a prefix sum computed once, so a cumulative curve is a slice and a window total is a subtraction.
+
+class DailySeries:
+    def __init__(self, first, keys, values, present):
+        self.first = first # Day ordinal of column 0
+        self.keys = keys
+        self.rows = {key: row for row, key in enumerate(keys)}
+        self.values = values # float64, keys x days
+        self.present = present # bool, days a key has an entry for
+        self.prefix = np.concatenate([np.zeros((len(keys), 1)), np.cumsum(values, axis=1)], axis=1)
+        self._day_strings = None
+
+    @classmethod
+    def from_dict(cls, series, startDate, endDate):
+        # key -> {day string: value} over startDate..endDate, keys keep their dict order
+        first = startDate.toordinal()
+        days = endDate.toordinal() - first + 1
+        keys = list(series)
+        values = np.zeros((len(keys), days))
+        present = np.zeros((len(keys), days), dtype=bool)
+        columns = {}
+        for row, key in enumerate(keys):
+            for day, value in series[key].items():
+                if day not in columns:
+                    columns[day] = day_ordinal(day) - first
+                values[row, columns[day]] = value
+                present[row, columns[day]] = True
+        return cls(first, keys, values, present)
+
+    def day_strings(self):
+        if self._day_strings is None:
+            self._day_strings = [day_string(self.first + column) for column in range(self.values.shape[1])]
+        return self._day_strings
+
+    def days(self, mask):
+        day_strings = self.day_strings()
+        return [day_strings[column] for column in np.flatnonzero(mask)]
+
+    def any_present(self):
+        return self.present.any(axis=0)
+
+    def running(self, key, mask=None):
+        # (days, running totals) on the days in mask, by default the days the key has an entry for
+        row = self.rows[key]
+        mask = self.present[row] if mask is None else mask
+        return self.days(mask), self.prefix[row, 1:][mask]
+
+    def total(self, key, startDate, endDate):
+        # Sum over startDate..endDate (clipped to the series' range) from two prefix lookups
+        start = max(startDate.toordinal() - self.first, 0)
+        end = min(endDate.toordinal() - self.first + 1, self.values.shape[1])
+        if end <= start:
+            return 0.0
+        row = self.rows[key]
+        return self.prefix[row, end] - self.prefix[row, start]
+
+    def combine(self, groups):
+        # New series whose rows sum the given rows: {new key: [keys]}
+        rows = [[self.rows[key] for key in keys] for keys in groups.values()]
+        values = np.array([self.values[group].sum(axis=0) for group in rows]).reshape(len(rows), self.values.shape[1])
+        present = np.array([self.present[group].any(axis=0) for group in rows]).reshape(len(rows), self.values.shape[1])
+        return DailySeries(self.first, list(groups), values, present)
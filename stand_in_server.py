@@ -0,0 +1,61 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for the getrecord API, serves records from a JSON dump (same shape as 1106data.json)
+# Usage: python stand_in_server.py 1106data.json --port 8000
+#        FOODBOT_API_URL=http://127.0.0.1:8000/beijingdev/dev/getrecord python app.py
+
+api_path = '/beijingdev/dev/getrecord'
+
+def make_handler(records, delay=0):
+    class GetRecordHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != api_path:
+                self.send_error(404)
+                return
+            query = parse_qs(url.query)
+            begin = query.get('beginTime', [''])[0]
+            end = query.get('endTime', ['9999-12-31'])[0]
+
+            if delay: # Simulate a slow API
+                time.sleep(delay)
+
+            matched = [data for data in records if begin <= data['addTime'].split(' ')[0] <= end] # Dates are inclusive
+            body = json.dumps(matched).encode('utf-8')
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args): # Keep the console quiet
+            pass
+
+    return GetRecordHandler
+
+def serve(records, port=0, delay=0):
+    # Starts the server on a background thread, port 0 picks a free port. Returns the server and its API url
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(records, delay))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}{api_path}'
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a getrecord JSON dump locally")
+    parser.add_argument('records', help="JSON file with a list of getrecord records")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--delay', type=float, default=0, help="Seconds to wait before each response")
+    args = parser.parse_args()
+
+    with open(args.records, 'r') as f:
+        records = json.load(f)
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(records, args.delay))
+    print(f"Serving {len(records)} records on http://127.0.0.1:{args.port}{api_path}")
+    server.serve_forever()
@@ -0,0 +1,290 @@
+import numpy as np
+
+import json
+import os
+import shutil
+import uuid
+from collections.abc import Mapping
+from datetime import date, datetime
+
+from rollup import load_rollup, write_rollup
+
+# Columnar event store, one row per weigh-in or POS purchase:
+#   card.npy    int64    card number
+#   day.npy     int32    date.toordinal() of the event's day
+#   station.npy int16    index into stations.json, -1 for a weigh-in
+#   weight.npy  float64  grams for a weigh-in, NaN for a purchase
+# plus members.json (card -> profile), the daily rollup cube (see rollup.py) and manifest.json, a summary of the
+# snapshot (date range, counts, source watermark, snapshot id) that can be read without opening the columns.
+# Rows are sorted by (day, card) and the arrays are memory-mapped on open.
+
+columns = ['card', 'day', 'station', 'weight']
+profile_keys = ['name', 'house', 'yeargroup', 'formclass', 'balance']
+manifestFilename = 'manifest.json'
+
+def day_string(ordinal):
+    return date.fromordinal(int(ordinal)).strftime('%Y-%m-%d')
+
+def day_ordinal(day):
+    return date.fromisoformat(day).toordinal()
+
+def snapshot_version(path):
+    # The manifest's snapshot id. Stores from before manifests: write_store swaps in freshly written files,
+    # so a new snapshot always has a new card.npy
+    manifest = read_manifest(path)
+    if manifest is not None:
+        return manifest['snapshot']
+    stat = os.stat(os.path.join(path, 'card.npy'))
+    return (os.path.abspath(path), stat.st_ino, stat.st_mtime_ns)
+
+def read_manifest(path):
+    file_path = os.path.join(path, manifestFilename)
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
+def write_manifest(path, card, day, station, stations, members, watermark=None, snapshot=None):
+    manifest = {
+        'snapshot': snapshot or uuid.uuid4().hex,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'first_day': day_string(day[0]) if len(day) else None, # Rows are sorted by day
+        'last_day': day_string(day[-1]) if len(day) else None,
+        'days': int(len(np.unique(day))),
+        'members': int(len(np.union1d(np.unique(card), np.array(list(members), dtype=np.int64)))),
+        'profiles': len(members),
+        'stations': len(stations),
+        'events': int(len(card)),
+        'weighins': int(np.count_nonzero(station < 0)),
+        'purchases': int(np.count_nonzero(station >= 0)),
+        'watermark': watermark, # addTime of the last ingested record, None when not built by report()
+    }
+    with open(os.path.join(path, manifestFilename), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+class EventStore(Mapping):
+    # Reads like the old card -> {day: {'stations', 'weights'}, profile...} dict, so existing analysis code keeps working,
+    # while the columns stay available for vectorized work
+    def __init__(self, card, day, station, weight, stations, members, path=None, version=None):
+        self.card = card
+        self.day = day
+        self.station = station
+        self.weight = weight
+        self.stations = stations # Station names, indexed by station code
+        self.members = members # card -> profile dict
+        self.path = path
+        self.version = version # Identifies the snapshot on disk, None for a store built in memory
+        self._card_rows = None
+        self._profiles = None
+        self._rollup = None
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        arrays = [np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r' if mmap else None) for column in columns]
+        with open(os.path.join(path, 'stations.json'), 'r') as f:
+            stations = json.load(f)
+        with open(os.path.join(path, 'members.json'), 'r') as f:
+            members = {int(card): profile for card, profile in json.load(f).items()}
+        return cls(*arrays, stations, members, path, snapshot_version(path))
+
+    def card_rows(self):
+        # Row numbers grouped by card (day order kept inside each card), built on first per-member access
+        if self._card_rows is None:
+            order = np.argsort(self.card, kind='stable')
+            cards, starts = np.unique(self.card[order], return_index=True)
+            ends = np.append(starts[1:], len(order))
+            self._card_rows = (order, {int(card): (start, end) for card, start, end in zip(cards, starts, ends)})
+        return self._card_rows
+
+    def profiles(self):
+        # card -> profile for every card in the store, in iteration order, without grouping the rows by card
+        if self._profiles is None:
+            cards = np.unique(self.card).tolist()
+            self._profiles = {card: self.members.get(card, {}) for card in cards}
+            for card, profile in self.members.items():
+                self._profiles.setdefault(card, profile)
+        return self._profiles
+
+    def rows_between(self, startDate, endDate):
+        # Rows are sorted by day, so a date range is one contiguous slice found by binary search
+        start = int(np.searchsorted(self.day, startDate.toordinal(), side='left'))
+        end = int(np.searchsorted(self.day, endDate.toordinal(), side='right'))
+        return start, end
+
+    def member_days(self, startDate, endDate):
+        # Yields (card, profile, day, {'stations', 'weights'}) for each member-day in the range, day by day.
+        # Only the rows of those days are read
+        start, end = self.rows_between(startDate, endDate)
+        if start == end:
+            return
+        card = np.asarray(self.card[start:end])
+        day = np.asarray(self.day[start:end])
+        bounds = np.flatnonzero((card[1:] != card[:-1]) | (day[1:] != day[:-1])) + 1
+        starts = [0] + bounds.tolist()
+        ends = bounds.tolist() + [end - start]
+
+        cards, days = card.tolist(), day.tolist()
+        station_codes = self.station[start:end].tolist()
+        weights = self.weight[start:end].tolist()
+        day_strings = {}
+        for first, last in zip(starts, ends):
+            if days[first] not in day_strings:
+                day_strings[days[first]] = day_string(days[first])
+            day_data = {'stations': [], 'weights': []}
+            for code, grams in zip(station_codes[first:last], weights[first:last]):
+                if code >= 0:
+                    day_data['stations'].append(self.stations[code])
+                else:
+                    day_data['weights'].append(grams)
+            yield cards[first], self.members.get(cards[first], {}), day_strings[days[first]], day_data
+
+    def rollup(self):
+        # (cube, specs) for a store on disk that has one, loaded on first use. A regenerate may have swapped a newer
+        # snapshot in under self.path since this store was opened, so a cube from any other snapshot isn't used
+        if self._rollup is None and self.path is not None:
+            try:
+                rollup = load_rollup(self.path)
+            except FileNotFoundError: # Swapped out between the check and the read
+                rollup = None
+            if rollup is not None and rollup[2] is None: # Older rollup without the id: it is this snapshot's if the manifest still is
+                current = snapshot_version(self.path) == self.version
+            else:
+                current = rollup is not None and rollup[2] == self.version
+            self._rollup = rollup[:2] if current else False
+        return self._rollup or None
+
+    def last_day(self):
+        return date.fromordinal(int(self.day[-1])) if len(self.day) else None
+
+    def __len__(self):
+        return len(self.card_rows()[1].keys() | self.members.keys())
+
+    def __iter__(self):
+        spans = self.card_rows()[1]
+        yield from spans
+        for card in self.members:
+            if card not in spans: # Profile with no events left, e.g. after days were dropped
+                yield card
+
+    def __getitem__(self, card):
+        order, spans = self.card_rows()
+        card = int(card)
+        if card not in spans and card not in self.members:
+            raise KeyError(card)
+
+        member_data = {}
+        if card in spans:
+            start, end = spans[card]
+            rows = order[start:end]
+            for day, station, weight in zip(self.day[rows].tolist(), self.station[rows].tolist(), self.weight[rows].tolist()):
+                day = day_string(day)
+                if day not in member_data:
+                    member_data[day] = {'stations': [], 'weights': []}
+                if station >= 0:
+                    member_data[day]['stations'].append(self.stations[station])
+                else:
+                    member_data[day]['weights'].append(weight)
+        member_data.update(self.members.get(card, {}))
+        return member_data
+
+def member_profiles(all_data):
+    # card -> profile for either an EventStore or the old nested dict (whose member dicts hold the profile keys)
+    if isinstance(all_data, EventStore):
+        return all_data.profiles()
+    return all_data
+
+def member_days(all_data, startDate, endDate):
+    # Member-days between startDate and endDate (inclusive) as (card, profile, day, day_data).
+    # A store answers from its day index, a plain dict has to be scanned
+    if isinstance(all_data, EventStore):
+        yield from all_data.member_days(startDate, endDate)
+        return
+    first, last = startDate.strftime('%Y-%m-%d'), endDate.strftime('%Y-%m-%d') # ISO day strings compare like dates
+    for member, member_data in all_data.items():
+        for day, day_data in member_data.items():
+            if day in profile_keys or day < first or day > last:
+                continue
+            yield member, member_data, day, day_data
+
+def events_from_dict(all_data):
+    # Flattens the nested card -> day dict into event columns
+    card, day, station, weight = [], [], [], []
+    stations = []
+    station_codes = {}
+    members = {}
+    ordinals = {}
+
+    for member, member_data in all_data.items():
+        member = int(member)
+        for key, day_data in member_data.items():
+            if key in profile_keys:
+                continue
+            if key not in ordinals:
+                ordinals[key] = day_ordinal(key)
+            for name in day_data.get('stations', []):
+                if name not in station_codes:
+                    station_codes[name] = len(stations)
+                    stations.append(name)
+                card.append(member)
+                day.append(ordinals[key])
+                station.append(station_codes[name])
+                weight.append(np.nan)
+            for grams in day_data.get('weights', []):
+                card.append(member)
+                day.append(ordinals[key])
+                station.append(-1)
+                weight.append(grams)
+        if 'name' in member_data:
+            members[member] = {key: member_data.get(key) for key in profile_keys}
+
+    return (np.array(card, dtype=np.int64), np.array(day, dtype=np.int32), np.array(station, dtype=np.int16),
+            np.array(weight, dtype=np.float64), stations, members)
+
+def write_store(path, card, day, station, weight, stations, members, watermark=None, check=None, sorted_rows=0, cube=None):
+    # Writes to a temporary directory first and swaps it in, readers never see a half written store.
+    # check() is called between the steps before the swap, whatever it raises drops the temporary directory.
+    # The first sorted_rows rows are already in order and hold whole days before every other row's day, like the
+    # unchanged days of an incremental regenerate: only the rest is sorted, and with the previous rollup cube only
+    # the rest is rolled up again
+    check = check or (lambda: None)
+    order = np.lexsort((card[sorted_rows:], day[sorted_rows:])) + sorted_rows # Stable, so purchases and weigh-ins keep their order within a member-day
+    order = np.concatenate([np.arange(sorted_rows), order])
+    tmp_path = path + '.tmp'
+    old_path = path + '.old'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    try:
+        card = np.asarray(card, dtype=np.int64)[order]
+        day = np.asarray(day, dtype=np.int32)[order]
+        station = np.asarray(station, dtype=np.int16)[order]
+        weight = np.asarray(weight, dtype=np.float64)[order]
+        check()
+        np.save(os.path.join(tmp_path, 'card.npy'), card)
+        np.save(os.path.join(tmp_path, 'day.npy'), day)
+        np.save(os.path.join(tmp_path, 'station.npy'), station)
+        np.save(os.path.join(tmp_path, 'weight.npy'), weight)
+        with open(os.path.join(tmp_path, 'stations.json'), 'w') as f:
+            json.dump(stations, f, ensure_ascii=False)
+        with open(os.path.join(tmp_path, 'members.json'), 'w') as f:
+            json.dump({str(card): profile for card, profile in members.items()}, f, ensure_ascii=False)
+        check()
+        snapshot = uuid.uuid4().hex # Names this snapshot in the manifest and in the rollup
+        write_rollup(tmp_path, card, day, station, weight, stations, members, snapshot, sorted_rows, cube)
+        write_manifest(tmp_path, card, day, station, stations, members, watermark, snapshot) # Last, a store without it isn't complete
+        check() # The last chance to back out, the swap below commits the snapshot
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def write_store_from_dict(path, all_data):
+    write_store(path, *events_from_dict(all_data))
+
+def is_store(path):
+    return os.path.exists(os.path.join(path, 'card.npy'))
@@ -0,0 +1,242 @@
+import pandas as pd
+import numpy as np
+
+import hashlib
+import json
+import os
+import pickle
+import zipfile
+from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor
+
+# Parsed-workbook cache: each POS export is parsed once and kept as a pickle of its sheets.
+# Entries are keyed on the workbook path and checked against its size and mtime; if those moved
+# the content hash decides whether the workbook really changed and needs parsing again.
+
+cacheDirectory = 'cache/workbooks'
+indexFilename = os.path.join(cacheDirectory, 'index.json')
+
+parseWorkers = os.cpu_count() or 1 # Processes used to parse workbooks that aren't cached, 1 parses in this process
+
+# merge_data only ever needs these two columns of a POS export
+cardColumn = '卡号'
+stationColumn = 'POS机名称'
+readerName = 'pos-columns' # Stored with each cache entry, parses made by a different reader are not reused
+
+spreadsheetNs = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+relationshipNs = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+rowTag = f'{spreadsheetNs}row'
+valueTag = f'{spreadsheetNs}v'
+
+def load_index():
+    if not os.path.exists(indexFilename):
+        return {}
+    with open(indexFilename, 'r') as f:
+        return json.load(f)
+
+def save_index(index):
+    os.makedirs(cacheDirectory, exist_ok=True)
+    tmp_filename = indexFilename + '.tmp'
+    with open(tmp_filename, 'w') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_filename, indexFilename)
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def file_signature(file_path):
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': file_hash(file_path)}
+
+def current_signature(signature, file_path):
+    # Checks file_path against a saved file_signature() (or a dict holding one): the size and mtime, or else the
+    # content hash. Returns None when the content changed, otherwise the signature as it is now, a copy with the new
+    # mtime when the file was only touched or copied, for the caller to save when it differs from what it passed in
+    stat = os.stat(file_path)
+    if signature['size'] != stat.st_size:
+        return None
+    if signature['mtime'] == stat.st_mtime_ns:
+        return signature
+    if signature['sha256'] == file_hash(file_path):
+        return {**signature, 'mtime': stat.st_mtime_ns}
+    return None
+
+def cached_sheets(entry):
+    with open(os.path.join(cacheDirectory, entry['cache']), 'rb') as f:
+        return pickle.load(f)
+
+def load_cached(index, file_path):
+    # Returns the cached sheets for file_path, or None if it has to be parsed
+    entry = index.get(file_path)
+    if entry is None or entry.get('reader') != readerName or not os.path.exists(os.path.join(cacheDirectory, entry['cache'])):
+        return None
+
+    current = current_signature(entry, file_path)
+    if current is None:
+        return None
+    if current != entry: # Touched or copied, but the same content
+        index[file_path] = current
+        save_index(index)
+    return cached_sheets(entry)
+
+def save_cached(index, file_path, sheets):
+    signature = file_signature(file_path)
+    cache_filename = f"{signature['sha256']}-{readerName}.pkl" # Content-addressed, identical workbooks share one entry
+    os.makedirs(cacheDirectory, exist_ok=True)
+    with open(os.path.join(cacheDirectory, cache_filename), 'wb') as f:
+        pickle.dump(sheets, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    old_entry = index.get(file_path)
+    index[file_path] = {**signature, 'cache': cache_filename, 'reader': readerName}
+    if old_entry and all(entry['cache'] != old_entry['cache'] for entry in index.values()):
+        stale_filename = os.path.join(cacheDirectory, old_entry['cache'])
+        if os.path.exists(stale_filename): # Drop the parse of the old version
+            os.remove(stale_filename)
+    save_index(index)
+
+def pos_frame(rows):
+    # Builds the projected sheet from (card, station) rows: card as int64, station name as a categorical
+    cards = np.fromiter((card for card, _ in rows), dtype=np.int64, count=len(rows))
+    names = pd.Categorical([name for _, name in rows])
+    return pd.DataFrame({cardColumn: cards, stationColumn: names})
+
+def column_index(ref):
+    # 'C12' -> 2
+    index = 0
+    for char in ref:
+        if char.isdigit():
+            break
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+def cell_value(cell, strings):
+    kind = cell.get('t')
+    if kind == 'inlineStr':
+        return ''.join(cell.itertext())
+    value = cell.findtext(valueTag)
+    if value is None:
+        return None
+    if kind == 's': # Index into the shared strings table
+        return strings[int(value)]
+    if kind in ('str', 'e'):
+        return value
+    if kind == 'b':
+        return value == '1'
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+def sheet_paths(archive):
+    # Sheet name -> worksheet XML inside the xlsx, in workbook order
+    relationships = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    targets = {relationship.get('Id'): relationship.get('Target') for relationship in relationships}
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    paths = {}
+    for sheet in workbook.iter(f'{spreadsheetNs}sheet'):
+        target = targets[sheet.get(f'{relationshipNs}id')]
+        paths[sheet.get('name')] = target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+    return paths
+
+def shared_strings(archive):
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    for _, element in ElementTree.iterparse(archive.open('xl/sharedStrings.xml')):
+        if element.tag == f'{spreadsheetNs}si': # Plain <t> or rich text runs <r><t>, phonetic runs are skipped
+            strings.append(''.join(text.text or '' for text in element.findall(f'{spreadsheetNs}t') + element.findall(f'{spreadsheetNs}r/{spreadsheetNs}t')))
+            element.clear()
+    return strings
+
+def read_pos_rows(archive, sheet_path, strings, file_path, sheet_name):
+    # Streams a worksheet's XML row by row and keeps only the card and station cells, as (card, station) tuples.
+    # file_path and sheet_name are only for the error when the header row lacks either column
+    header = None
+    card_column = station_column = None
+    kept = []
+
+    for _, element in ElementTree.iterparse(archive.open(sheet_path)):
+        if element.tag != rowTag:
+            continue
+        values = {}
+        position = 0
+        for cell in element:
+            ref = cell.get('r')
+            column = column_index(ref) if ref else position
+            position = column + 1
+            if header is None or column == card_column or column == station_column:
+                values[column] = cell_value(cell, strings)
+        element.clear()
+
+        if header is None:
+            header = {value: column for column, value in values.items()}
+            if cardColumn not in header or stationColumn not in header:
+                missing = [column for column in (cardColumn, stationColumn) if column not in header]
+                raise ValueError(f"{file_path}, sheet '{sheet_name}': no {' or '.join(missing)} column in the header row")
+            card_column = header[cardColumn]
+            station_column = header[stationColumn]
+            continue
+
+        card = values.get(card_column)
+        if card is None or card == '':
+            continue
+        kept.append((card if isinstance(card, int) else int(float(card)), values.get(station_column)))
+    return kept
+
+def workbook_parts(file_path):
+    # (shared strings, [(sheet name, sheet XML path)] in workbook order), what every sheet of the workbook needs
+    with zipfile.ZipFile(file_path) as archive:
+        return shared_strings(archive), list(sheet_paths(archive).items())
+
+def read_pos_sheets(file_path, sheets, strings):
+    # Some of a workbook's [(sheet name, sheet XML path)] with its already parsed shared strings, one pool task
+    with zipfile.ZipFile(file_path) as archive:
+        return {sheet_name: pos_frame(read_pos_rows(archive, sheet_path, strings, file_path, sheet_name)) for sheet_name, sheet_path in sheets}
+
+def read_pos_workbook(file_path):
+    # Column-projected stand-in for pd.read_excel(file_path, sheet_name=None) on a POS export
+    strings, sheets = workbook_parts(file_path)
+    return read_pos_sheets(file_path, sheets, strings)
+
+def read_workbook(file_path):
+    # Reads a POS export's sheets through read_pos_workbook, only new or modified workbooks are parsed
+    index = load_index()
+    sheets = load_cached(index, file_path)
+    if sheets is None:
+        print(f"Parsing {file_path}...")
+        sheets = read_pos_workbook(file_path)
+        save_cached(index, file_path, sheets)
+    return sheets
+
+def read_workbooks(file_paths, workers=None):
+    # read_workbook for many files: cached workbooks are loaded here, the rest are split into chunks of sheets and
+    # parsed across a process pool, so even the one new monthly export of a regenerate uses every worker. Each workbook's
+    # shared strings and sheet list are parsed once, here, and sent with its chunks.
+    # Results come back in file_paths order with each workbook's sheet order kept
+    workers = workers or parseWorkers
+    index = load_index()
+    results = [load_cached(index, file_path) for file_path in file_paths]
+    missing = [i for i, sheets in enumerate(results) if sheets is None]
+
+    if workers <= 1 or not missing:
+        for i in missing:
+            results[i] = read_workbook(file_paths[i])
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tasks = []
+        for i in missing:
+            print(f"Parsing {file_paths[i]}...")
+            strings, sheets = workbook_parts(file_paths[i])
+            chunks = [sheets[k::workers] for k in range(min(workers, len(sheets)))] # Day sheets are about the same size
+            tasks.append((i, sheets, [executor.submit(read_pos_sheets, file_paths[i], chunk, strings) for chunk in chunks]))
+
+        for i, sheets, futures in tasks:
+            parsed = {}
+            for future in futures:
+                parsed.update(future.result())
+            results[i] = {sheet_name: parsed[sheet_name] for sheet_name, _ in sheets}
+            save_cached(index, file_paths[i], results[i])
+    return results